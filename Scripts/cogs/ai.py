@@ -1,39 +1,252 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import anthropic
 import asyncio
+import hashlib
+import json
 import logging
-from collections import defaultdict
-import configparser
 import os
-from typing import Dict, Any
-import time
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from utils.admission import AdmissionController, QueueFull
+from utils.cache import SingleFlight, TTLCache
+from utils.config import get_config
+from utils.conversation import Conversation, ConversationStore, TokenCounter, Turn, has_cache_breakpoints
+from utils.live_message import LiveMessage
+from utils.metrics import track_external
+from utils.usage_ledger import UsageLedger, month_start, today
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s:%(levelname)s:%(message)s')
 logger = logging.getLogger(__name__)
 
+MODEL = "claude-3-sonnet-20240229"
+MAX_TOKENS = 1024
+PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_PROMPT_TOKENS = 100  # the instructions around each part sent to be summarized
+
 class ClaudeAI(commands.Cog):
     """A cog for interacting with Claude AI."""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        
-        # Read config
-        self.config = configparser.ConfigParser()
-        self.config.read(os.path.expanduser('~/Python/.config'))
-        
-        self.claude = anthropic.Anthropic(api_key=self.config['Anthropic']['API-KEY'])
-        self.allowed_users = self.config['AI']['allowed_users'].split(',')
-        self.input_cost_per_1m_tokens = float(self.config['AI']['input_cost_per_1m_tokens'])
-        self.output_cost_per_1m_tokens = float(self.config['AI']['output_cost_per_1m_tokens'])
-        self.user_stats: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"total_input_tokens": 0, "total_output_tokens": 0, "total_cost": 0.0, "last_use": 0})
-        self.rate_limit = float(self.config['AI']['rate_limit'])  # in seconds
+        self.config = get_config()
+        self.admission: Optional[AdmissionController] = None
+        self.conversations: Optional[ConversationStore] = None
+        self.background_tasks = set()
+        # Worst-case cost of requests that have passed the budget check but not been billed yet
+        self.reserved_user: Dict[str, float] = {}
+        self.reserved_total = 0.0
+        self.apply_config(self.config)
+        self.config.subscribe('AI', self.apply_config)
+        self.config.subscribe('Anthropic', self.apply_config)
+
+    async def cog_unload(self):
+        self.config.unsubscribe('AI', self.apply_config)
+        self.config.unsubscribe('Anthropic', self.apply_config)
+        self.persist_cache.cancel()
+        # Stop conversation summaries and shared generations before the client and ledger they use close
+        for task in list(self.background_tasks):
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        await self.in_flight.cancel_all()
+        await self.save_cache()
+        await self.ledger.close()
+        await self.claude.close()
+
+    def apply_config(self, config):
+        """Load the AI settings, also called when [AI] or [Anthropic] changes on disk."""
+        ai_config = config.ai
+        if getattr(self, 'api_key', None) != ai_config.api_key:
+            # Only a new key needs a new client. The old one isn't closed: answers and summaries
+            # may still be streaming through it, and it is let go once they are done with it
+            self.api_key = ai_config.api_key
+            self.claude = anthropic.AsyncAnthropic(api_key=ai_config.api_key)
+        self.allowed_users = ai_config.allowed_users
+        self.prices = {MODEL: (ai_config.input_cost_per_1m_tokens, ai_config.output_cost_per_1m_tokens)}
+        self.fast_model = ai_config.fast_model
+        self.fast_model_max_prompt_tokens = ai_config.fast_model_max_prompt_tokens
+        if self.fast_model:
+            self.prices[self.fast_model] = (ai_config.fast_input_cost_per_1m_tokens,
+                                            ai_config.fast_output_cost_per_1m_tokens)
+        self.daily_user_budget = ai_config.daily_user_budget
+        self.monthly_budget = ai_config.monthly_budget
+        self.summarize_max_messages = ai_config.summarize_max_messages
+        # Parts must hold at least two part summaries, or summarizing them again would never shrink them
+        self.summarize_chunk_tokens = max(ai_config.summarize_chunk_tokens, 2 * SUMMARY_MAX_TOKENS)
+        self.summarize_concurrency = ai_config.summarize_concurrency
+        self.rate_limit = ai_config.rate_limit  # in seconds per request, per user
+        admission_settings = dict(
+            user_rate=1 / self.rate_limit if self.rate_limit > 0 else float('inf'), user_burst=ai_config.user_burst,
+            global_rate=ai_config.global_requests_per_minute / 60, global_burst=ai_config.global_burst,
+            max_concurrent=ai_config.max_concurrent, max_queued_per_user=ai_config.max_queued_per_user,
+        )
+        if self.admission is None:
+            self.admission = AdmissionController(**admission_settings)
+        else:
+            self.admission.configure(**admission_settings)
+
+        self.system_prompt = ai_config.system_prompt
+        summarizer = self.summarize if ai_config.summarize_context else None
+        if self.conversations is None:
+            self.conversations = ConversationStore(TokenCounter(ai_config.tokenizer_file), ai_config.context_tokens,
+                                                   ai_config.context_idle_minutes * 60, summarizer)
+        else:
+            self.conversations.budget_tokens = ai_config.context_tokens
+            self.conversations.max_idle = ai_config.context_idle_minutes * 60
+            self.conversations.summarizer = summarizer
+        self.cache_file = os.path.join(config.paths.json_folder, "ai_cache.json")
+        self.usage_db = ai_config.usage_db
+        self.cache_ttl = ai_config.cache_ttl
+        self.cache_size = ai_config.cache_size
+        if hasattr(self, 'response_cache'):
+            self.response_cache.ttl = self.cache_ttl
+            self.response_cache.maxsize = self.cache_size
+
+    async def cog_load(self):
+        self.ledger = UsageLedger(self.usage_db)
+        await self.ledger.open()
+
+        self.response_cache = TTLCache(self.cache_size, self.cache_ttl)
+        self.in_flight = SingleFlight()
+        self.cache_stats = {"coalesced": 0, "saved": 0.0}
+        self.cache_dirty = False
+        try:
+            data = await asyncio.to_thread(self.read_cache_file)
+            self.response_cache.load(data.get("entries", []))
+            stats = data.get("stats", {})
+            self.response_cache.hits = stats.get("hits", 0)
+            self.response_cache.misses = stats.get("misses", 0)
+            self.cache_stats.update({key: stats[key] for key in self.cache_stats if key in stats})
+            logger.info(f"Loaded {len(self.response_cache)} cached AI responses")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load AI response cache {self.cache_file}: {e}")
+        self.persist_cache.start()
+
+    def read_cache_file(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def write_cache_file(self, data: str):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+        os.replace(tmp_file, self.cache_file)
+
+    async def save_cache(self):
+        self.cache_dirty = False
+        data = json.dumps({
+            "entries": self.response_cache.dump(),
+            "stats": {"hits": self.response_cache.hits, "misses": self.response_cache.misses, **self.cache_stats},
+        })
+        await asyncio.to_thread(self.write_cache_file, data)
+
+    @tasks.loop(minutes=5)
+    async def persist_cache(self):
+        # Write-behind: answers are cached in memory right away and saved here in batches
+        if self.cache_dirty:
+            await self.save_cache()
+
+    @staticmethod
+    def cache_key(model: str, phrase: str) -> str:
+        normalized = " ".join(phrase.casefold().split())
+        return hashlib.sha256(f"{model}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def choose_model(self, phrase: str) -> str:
+        """Short questions go to the faster, cheaper model when one is configured."""
+        if self.fast_model and self.conversations.counter.count(phrase) <= self.fast_model_max_prompt_tokens:
+            return self.fast_model
+        return MODEL
+
+    def estimate_cost(self, model: str, system: List[Dict[str, Any]], messages: List[Dict[str, Any]],
+                      max_tokens: int = MAX_TOKENS) -> float:
+        """Upper bound for the cost of a request: its input counted locally, plus a full-length answer."""
+        count = self.conversations.counter.count
+        input_tokens = sum(count(block["text"]) for block in system)
+        input_tokens += sum(count(block["text"]) for message in messages for block in message["content"])
+        input_price, output_price = self.prices[model]
+        return (input_tokens * input_price + max_tokens * output_price) / 1_000_000
+
+    async def check_budget(self, user: str, estimate: float) -> Optional[str]:
+        """Return why the request would go over a budget, or None if it may go ahead."""
+        if self.daily_user_budget > 0:
+            spent = (await self.ledger.user_totals(user, since_day=today())).cost + self.reserved_user.get(user, 0.0)
+            if spent + estimate > self.daily_user_budget:
+                return (f"This would go over your daily AI budget of ${self.daily_user_budget:.2f} "
+                        f"(${spent:.4f} used today). It resets at midnight UTC.")
+        if self.monthly_budget > 0:
+            spent = (await self.ledger.day_totals(month_start())).cost + self.reserved_total
+            if spent + estimate > self.monthly_budget:
+                return f"The monthly AI budget of ${self.monthly_budget:.2f} has been used up."
+        return None
+
+    def reserve(self, user: str, amount: float):
+        self.reserved_user[user] = self.reserved_user.get(user, 0.0) + amount
+        self.reserved_total += amount
+
+    async def generate(self, reply: LiveMessage, model: str, system: List[Dict[str, Any]],
+                       messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Stream an answer from Claude into `reply` and return it with its usage."""
+        with track_external():
+            async with self.claude.messages.stream(
+                model=model,
+                max_tokens=MAX_TOKENS,
+                system=system,
+                messages=messages,
+                # Only requests with cache breakpoints need the beta
+                extra_headers=PROMPT_CACHING_HEADERS if has_cache_breakpoints(system, messages) else None,
+            ) as stream:
+                reply.set_text("Claude: ")
+                async for text in stream.text_stream:
+                    reply.append(text)
+                response = await stream.get_final_message()
+
+        return {"text": "".join(block.text for block in response.content if block.type == "text"),
+                "model": model, **self.usage_costs(model, response.usage)}
+
+    def usage_costs(self, model: str, usage) -> Dict[str, Any]:
+        # Prompt cache writes cost 25% more than plain input tokens, cache reads 90% less
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        billed_input = usage.input_tokens + cache_write * 1.25 + cache_read * 0.1
+        input_price, output_price = self.prices[model]
+        return {
+            "input_tokens": usage.input_tokens + cache_write + cache_read,
+            "cached_input_tokens": cache_read,
+            "output_tokens": usage.output_tokens,
+            "input_cost": (billed_input / 1_000_000) * input_price,
+            "output_cost": (usage.output_tokens / 1_000_000) * output_price,
+        }
+
+    async def summarize(self, summary: str, turns: List[Turn]) -> str:
+        """Fold conversation turns that no longer fit the context budget into the running summary."""
+        transcript = "\n\n".join(f"User: {turn.question}\nClaude: {turn.answer}" for turn in turns)
+        prompt = (f"Summary so far:\n{summary or '(none)'}\n\nLater conversation:\n{transcript}\n\n"
+                  "Write an updated summary of the whole conversation in at most 150 words. "
+                  "Keep names, facts and open questions that later messages may refer to.")
+        model = self.fast_model or MODEL
+        with track_external():
+            response = await self.claude.messages.create(
+                model=model,
+                max_tokens=400,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        costs = self.usage_costs(model, response.usage)
+        self.ledger.record("(conversation summaries)", None, model, costs["input_tokens"], costs["output_tokens"],
+                           costs["input_cost"] + costs["output_cost"])
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    async def trim_conversation(self, conv: Conversation):
+        async with conv.lock:
+            await self.conversations.trim(conv)
 
     @commands.command(name="ai")
     async def ai_response(self, ctx: commands.Context, *, phrase: str):
-        """Generate a response using Claude AI."""
+        """Generate a response using Claude AI. Claude remembers the recent conversation in each channel."""
         logger.info(f"Command 'ai' used by {ctx.author.name} with question: {phrase}")
         
         if ctx.author.name.lower() not in self.allowed_users:
@@ -41,54 +254,306 @@ class ClaudeAI(commands.Cog):
             logger.warning(f"Unauthorized 'ai' command attempt by {ctx.author.name}")
             return
 
-        # Rate limiting
-        current_time = time.time()
-        if current_time - self.user_stats[ctx.author.name.lower()]["last_use"] < self.rate_limit:
-            await ctx.send(f"Please wait {self.rate_limit} seconds between requests.")
-            return
-        self.user_stats[ctx.author.name.lower()]["last_use"] = current_time
-
+        user = ctx.author.name.lower()
+        conv = self.conversations.get(ctx.channel.id)
+        model = self.choose_model(phrase)
+        reply = None
+        reserved = 0.0
         try:
             message = await ctx.send("Thinking...")
+            reply = LiveMessage(message)
 
-            response = await asyncio.to_thread(
-                self.claude.messages.create,
-                model="claude-3-sonnet-20240229",
-                max_tokens=1024,
-                messages=[
-                    {"role": "user", "content": phrase}
-                ]
-            )
+            # Questions in the same channel are answered in order, each with the previous ones as context
+            async with conv.lock:
+                system, messages = self.conversations.build_request(conv, self.system_prompt, phrase, model)
+                # Answers to follow-up questions depend on the conversation, so only fresh questions are reused
+                shareable = conv.is_empty
+                key = self.cache_key(model, phrase)
+                result = self.response_cache.get(key) if shareable else None
+                joins_in_flight = shareable and self.in_flight.in_flight(key)
+                if result is not None:
+                    source = "cached answer"
+                elif not joins_in_flight and not self.admission.has_room(user):
+                    raise QueueFull()
+                else:
+                    if not joins_in_flight:
+                        # Checked before anything is sent, against the worst case for this request
+                        estimate = self.estimate_cost(model, system, messages)
+                        over_budget = await self.check_budget(user, estimate)
+                        if over_budget is not None:
+                            reply.set_text(over_budget)
+                            logger.info(f"AI request by {ctx.author.name} refused: {over_budget}")
+                            return
+                        self.reserve(user, estimate)
+                        reserved = estimate
 
-            ai_response = response.content[0].text
-            input_tokens = response.usage.input_tokens
-            output_tokens = response.usage.output_tokens
-            total_tokens = input_tokens + output_tokens
+                    async def admitted_generate():
+                        # Over the rate limits or out of slots: wait in line instead of being turned away
+                        async with self.admission.slot(user, on_position=lambda position:
+                                                       reply.set_text(f"Waiting in line for Claude (#{position})...")):
+                            return await self.generate(reply, model, system, messages)
+
+                    if shareable:
+                        # Identical questions asked while this one is being answered share the same call
+                        result, shared = await self.in_flight.do(key, admitted_generate)
+                    else:
+                        result, shared = await admitted_generate(), False
+                    if shared:
+                        source = "answer shared with an identical question"
+                        self.cache_stats["coalesced"] += 1
+                    else:
+                        source = None
+                        if shareable:
+                            self.response_cache.set(key, result)
+                            self.cache_dirty = True
+                self.conversations.add_turn(conv, phrase, result["text"])
 
-            input_cost = (input_tokens / 1_000_000) * self.input_cost_per_1m_tokens
-            output_cost = (output_tokens / 1_000_000) * self.output_cost_per_1m_tokens
+            if self.conversations.needs_trim(conv):
+                # Summarize old turns in the background; the next question in this channel waits for it
+                task = asyncio.create_task(self.trim_conversation(conv))
+                self.background_tasks.add(task)
+                task.add_done_callback(self.background_tasks.discard)
+
+            input_tokens = result["input_tokens"]
+            output_tokens = result["output_tokens"]
+            total_tokens = input_tokens + output_tokens
+            input_cost = result["input_cost"]
+            output_cost = result["output_cost"]
             total_cost = input_cost + output_cost
 
-            # Update user stats
-            user_stats = self.user_stats[ctx.author.name.lower()]
-            user_stats["total_input_tokens"] += input_tokens
-            user_stats["total_output_tokens"] += output_tokens
-            user_stats["total_cost"] += total_cost
-
-            await message.edit(content=f"Claude: {ai_response}\n\n"
-                                       f"Tokens used: {total_tokens} "
-                                       f"(Input: {input_tokens}, Output: {output_tokens})\n"
-                                       f"Estimated cost: ${total_cost:.6f} "
-                                       f"(Input: ${input_cost:.6f}, Output: ${output_cost:.6f})")
+            reply.set_text(f"Claude: {result['text']}")
+            if source is not None:
+                self.cache_stats["saved"] += total_cost
+                self.cache_dirty = True
+                await reply.finish(f"\n\n(Reused {source}, saved ${total_cost:.6f})")
+                reply = None
+                logger.info(f"AI {source} given to {ctx.author.name}")
+                return
+
+            # Queued here, written to the usage database in the background
+            self.ledger.record(user, ctx.guild.id if ctx.guild else None, result.get("model", model),
+                               input_tokens, output_tokens, total_cost)
+
+            cached_input = result.get("cached_input_tokens", 0)
+            cached_note = f", {cached_input} from prompt cache" if cached_input else ""
+            await reply.finish(f"\n\nTokens used: {total_tokens} "
+                               f"(Input: {input_tokens}{cached_note}, Output: {output_tokens})\n"
+                               f"Estimated cost: ${total_cost:.6f} "
+                               f"(Input: ${input_cost:.6f}, Output: ${output_cost:.6f}), "
+                               f"model: {result.get('model', model)}")
+            reply = None
             
-            logger.info(f"AI response given to {ctx.author.name}: {ai_response}")
+            logger.info(f"AI response given to {ctx.author.name}: {result['text']}")
 
+        except QueueFull:
+            reply.set_text("You already have questions waiting for Claude. Please wait for those to be answered.")
         except anthropic.APIError as e:
             await ctx.send(f"An error occurred with the AI service: {str(e)}")
             logger.error(f"Anthropic API error in 'ai' command used by {ctx.author.name}: {e}")
         except Exception as e:
             await ctx.send("An unexpected error occurred. Please try again later.")
             logger.error(f"Unexpected error in 'ai' command used by {ctx.author.name}: {e}")
+        finally:
+            if reserved:
+                # Recorded in the ledger by now, or never billed
+                self.reserve(user, -reserved)
+            if reply is not None:
+                # Keep whatever part of the answer had arrived before the error
+                await reply.finish()
+
+    @staticmethod
+    def parse_span(span: str) -> Tuple[Optional[int], Optional[timedelta]]:
+        """`200` is a number of messages, `since 3h` (or just `3h`, `1d12h`, `45m`) a time span."""
+        span = span.strip().lower()
+        if span.isdigit():
+            return int(span), None
+        span = span[len("since"):].strip() if span.startswith("since") else span
+        matches = re.fullmatch(r'(?:\d+[dhm])+', span) and re.findall(r'(\d+)([dhm])', span)
+        if not matches:
+            return None, None
+        units = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+        delta = timedelta()
+        for value, unit in matches:
+            delta += timedelta(**{units[unit]: int(value)})
+        return None, delta
+
+    async def read_history(self, ctx: commands.Context, limit: int, after: Optional[datetime]) -> List[str]:
+        """The channel's messages before the command as `author: text` lines, oldest first."""
+        lines = []
+        # Newest first, so a span with more messages than the limit keeps the latest ones
+        async for message in ctx.channel.history(limit=limit, before=ctx.message, after=after, oldest_first=False):
+            if message.author.bot or not message.content:
+                continue
+            lines.append(f"[{message.created_at:%Y-%m-%d %H:%M}] {message.author.display_name}: {message.content}")
+        lines.reverse()
+        return lines
+
+    async def summarize_part(self, user: str, guild_id: Optional[int], model: str, text: str) -> str:
+        with track_external():
+            response = await self.claude.messages.create(
+                model=model,
+                max_tokens=SUMMARY_MAX_TOKENS,
+                messages=[{"role": "user", "content": text}]
+            )
+        costs = self.usage_costs(model, response.usage)
+        self.ledger.record(user, guild_id, model, costs["input_tokens"], costs["output_tokens"],
+                           costs["input_cost"] + costs["output_cost"])
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    def summary_request(self, channel_name: str, parts: List[str], partial: bool) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        if partial:
+            prompt = (f"Here are summaries of consecutive parts of a Discord conversation in #{channel_name}, "
+                      f"oldest first:\n\n" + "\n\n---\n\n".join(parts) + "\n\n"
+                      "Merge them into one summary of the whole conversation: the main topics, decisions, "
+                      "and open questions, in the order they came up.")
+        else:
+            prompt = (f"Here is a Discord chat log from #{channel_name}:\n\n{parts[0]}\n\n"
+                      "Summarize it: the main topics, decisions, and open questions, in the order they came up.")
+        system = [{"type": "text", "text": self.system_prompt}]
+        return system, [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+
+    async def map_summaries(self, reply: LiveMessage, user: str, guild_id: Optional[int], channel_name: str,
+                            parts: List[str], partial: bool) -> List[str]:
+        """Summarize every part separately, at most `summarize_concurrency` at a time."""
+        model = self.fast_model or MODEL
+        semaphore = asyncio.Semaphore(max(1, self.summarize_concurrency))
+        done = 0
+
+        async def summarize_one(part: str) -> str:
+            nonlocal done
+            async with semaphore:
+                intro = (f"Here are summaries of consecutive parts of a Discord conversation in #{channel_name}:"
+                         if partial else f"Here is part of a Discord chat log from #{channel_name}:")
+                summary = await self.summarize_part(user, guild_id, model, (
+                    f"{intro}\n\n{part}\n\nSummarize this in at most 150 words: the topics discussed, "
+                    "decisions made and open questions. Mention who said what when it matters."))
+            done += 1
+            reply.set_text(f"Summarizing {len(parts)} parts of the conversation ({done}/{len(parts)} done)...")
+            return summary
+
+        return list(await asyncio.gather(*(summarize_one(part) for part in parts)))
+
+    def estimate_summary_cost(self, channel_name: str, chunks: List[str]) -> float:
+        """Worst case for every round of map calls plus the final merge, taking each part
+        summary to be full length. Follows the same rounds as `summarize_channel`."""
+        if len(chunks) == 1:
+            return self.estimate_cost(MODEL, *self.summary_request(channel_name, chunks, partial=False))
+        map_input_price, map_output_price = self.prices[self.fast_model or MODEL]
+        estimate = 0.0
+        part_tokens = self.conversations.counter.count_batch(chunks)
+        while True:
+            estimate += sum((tokens + SUMMARY_PROMPT_TOKENS) * map_input_price + SUMMARY_MAX_TOKENS * map_output_price
+                            for tokens in part_tokens) / 1_000_000
+            summaries = len(part_tokens)
+            if summaries * SUMMARY_MAX_TOKENS <= self.summarize_chunk_tokens:
+                break
+            per_part = self.summarize_chunk_tokens // SUMMARY_MAX_TOKENS
+            next_parts = -(-summaries // per_part)
+            if next_parts >= summaries:
+                break
+            part_tokens = [per_part * SUMMARY_MAX_TOKENS] * next_parts
+        input_price, output_price = self.prices[MODEL]
+        merge_input = (summaries * SUMMARY_MAX_TOKENS + SUMMARY_PROMPT_TOKENS
+                       + self.conversations.counter.count(self.system_prompt))
+        return estimate + (merge_input * input_price + MAX_TOKENS * output_price) / 1_000_000
+
+    @commands.command(name="summarize")
+    async def summarize_channel(self, ctx: commands.Context, *, span: str = "100"):
+        """
+        Summarize the recent conversation in this channel.
+
+        Usage:
+        .summarize [number of messages]
+        .summarize since <time> (e.g. 3h, 1d, 45m)
+        """
+        logger.info(f"Command 'summarize' used by {ctx.author.name} with span: {span}")
+        if ctx.author.name.lower() not in self.allowed_users:
+            await ctx.send("Sorry, you're not authorized to use this command.")
+            logger.warning(f"Unauthorized 'summarize' command attempt by {ctx.author.name}")
+            return
+
+        count, delta = self.parse_span(span)
+        if count is None and delta is None:
+            await ctx.send("Usage: `.summarize [number of messages]` or `.summarize since <time>` (e.g. 3h, 1d, 45m)")
+            return
+        limit = min(count or self.summarize_max_messages, self.summarize_max_messages)
+        after = datetime.now(timezone.utc) - delta if delta is not None else None
+
+        user = ctx.author.name.lower()
+        guild_id = ctx.guild.id if ctx.guild else None
+        channel_name = getattr(ctx.channel, 'name', 'direct messages')
+        reply = None
+        reserved = 0.0
+        try:
+            reply = LiveMessage(await ctx.send("Reading the channel history..."))
+            lines = await self.read_history(ctx, limit, after)
+            if not lines:
+                reply.set_text("There are no messages to summarize.")
+                return
+            chunks = self.conversations.counter.chunks(lines, self.summarize_chunk_tokens)
+
+            estimate = self.estimate_summary_cost(channel_name, chunks)
+            over_budget = await self.check_budget(user, estimate)
+            if over_budget is not None:
+                reply.set_text(over_budget)
+                logger.info(f"Summary requested by {ctx.author.name} refused: {over_budget}")
+                return
+            self.reserve(user, estimate)
+            reserved = estimate
+
+            # The whole summary counts as one request against the rate limits
+            async with self.admission.slot(user, on_position=lambda position:
+                                           reply.set_text(f"Waiting in line for Claude (#{position})...")):
+                parts, partial = chunks, False
+                # Map: summarize the parts concurrently, again if the summaries are still too long to merge at once
+                while len(parts) > 1:
+                    parts = await self.map_summaries(reply, user, guild_id, channel_name, parts, partial)
+                    partial = True
+                    if sum(self.conversations.counter.count_batch(parts)) <= self.summarize_chunk_tokens:
+                        break
+                    rechunked = self.conversations.counter.chunks(parts, self.summarize_chunk_tokens)
+                    if len(rechunked) >= len(parts):
+                        break  # another round wouldn't make fewer parts; merge these as they are
+                    parts = rechunked
+                # Reduce: one streamed call merges the partial summaries (or summarizes a short history directly)
+                result = await self.generate(reply, MODEL, *self.summary_request(channel_name, parts, partial))
+
+            self.ledger.record(user, guild_id, MODEL, result["input_tokens"], result["output_tokens"],
+                               result["input_cost"] + result["output_cost"])
+            reply.set_text(f"Claude: {result['text']}")
+            await reply.finish(f"\n\n(Summary of {len(lines)} messages in {len(chunks)} "
+                               f"part{'s' if len(chunks) != 1 else ''})")
+            reply = None
+            logger.info(f"Summary of {len(lines)} messages in {len(chunks)} parts given to {ctx.author.name}")
+
+        except QueueFull:
+            reply.set_text("You already have questions waiting for Claude. Please wait for those to be answered.")
+        except anthropic.APIError as e:
+            await ctx.send(f"An error occurred with the AI service: {str(e)}")
+            logger.error(f"Anthropic API error in 'summarize' command used by {ctx.author.name}: {e}")
+        except discord.Forbidden:
+            await ctx.send("I don't have permission to read the history of this channel.")
+        except Exception as e:
+            await ctx.send("An unexpected error occurred. Please try again later.")
+            logger.error(f"Unexpected error in 'summarize' command used by {ctx.author.name}: {e}")
+        finally:
+            if reserved:
+                self.reserve(user, -reserved)
+            if reply is not None:
+                await reply.finish()
+
+    @commands.command(name="aireset")
+    async def ai_reset(self, ctx: commands.Context):
+        """Make Claude forget the conversation in this channel."""
+        if ctx.author.name.lower() not in self.allowed_users:
+            await ctx.send("Sorry, you're not authorized to use this command.")
+            logger.warning(f"Unauthorized 'aireset' command attempt by {ctx.author.name}")
+            return
+        if self.conversations.reset(ctx.channel.id):
+            await ctx.send("Claude has forgotten the conversation in this channel.")
+        else:
+            await ctx.send("There is no conversation to forget in this channel.")
+        logger.info(f"AI conversation in channel {ctx.channel.id} reset by {ctx.author.name}")
 
     @commands.command(name="aistats")
     async def ai_stats(self, ctx: commands.Context):
@@ -99,15 +564,35 @@ class ClaudeAI(commands.Cog):
             logger.warning(f"Unauthorized 'aistats' command attempt by {ctx.author.name}")
             return
 
-        user_stats = self.user_stats[ctx.author.name.lower()]
-        total_input_tokens = user_stats["total_input_tokens"]
-        total_output_tokens = user_stats["total_output_tokens"]
-        total_cost = user_stats["total_cost"]
+        user_totals = await self.ledger.user_totals(ctx.author.name.lower())
+        user_today = await self.ledger.user_totals(ctx.author.name.lower(), since_day=today())
+        guild_totals = await self.ledger.guild_totals(ctx.guild.id if ctx.guild else None)
+        everyone_today = await self.ledger.day_totals(today())
+        everyone_month = await self.ledger.day_totals(month_start())
+        daily_budget = f" of ${self.daily_user_budget:.2f} budget" if self.daily_user_budget > 0 else ""
+        monthly_budget = f" of ${self.monthly_budget:.2f} budget" if self.monthly_budget > 0 else ""
+        cache = self.response_cache
+        coalesced = self.cache_stats['coalesced']
+        lookups = cache.hits + cache.misses  # shared answers started out as cache misses
+        reuse_rate = (cache.hits + coalesced) / lookups if lookups else 0.0
 
         await ctx.send(f"AI Usage Stats for {ctx.author.name}:\n"
-                       f"Total input tokens: {total_input_tokens}\n"
-                       f"Total output tokens: {total_output_tokens}\n"
-                       f"Total estimated cost: ${total_cost:.6f}")
+                       f"Total requests: {user_totals.requests}\n"
+                       f"Total input tokens: {user_totals.input_tokens}\n"
+                       f"Total output tokens: {user_totals.output_tokens}\n"
+                       f"Total estimated cost: ${user_totals.cost:.6f}\n"
+                       f"Today: {user_today.requests} requests, ${user_today.cost:.6f}{daily_budget}\n"
+                       f"{'This server' if ctx.guild else 'Direct messages'}: {guild_totals.requests} requests, "
+                       f"${guild_totals.cost:.6f}\n"
+                       f"Everyone today: {everyone_today.requests} requests, ${everyone_today.cost:.6f}\n"
+                       f"Everyone this month: {everyone_month.requests} requests, "
+                       f"${everyone_month.cost:.6f}{monthly_budget}\n"
+                       f"Response cache: {len(cache)} answers, {reuse_rate:.0%} of questions reused "
+                       f"({cache.hits} cache hits, {coalesced} shared in flight, "
+                       f"{cache.misses - coalesced} API calls), saved ${self.cache_stats['saved']:.6f}\n"
+                       f"Requests running: {self.admission.active}/{self.admission.max_concurrent}, "
+                       f"waiting: {self.admission.waiting} ({self.admission.queued} of "
+                       f"{self.admission.admitted} admitted requests had to wait)")
         logger.info(f"AI stats provided to {ctx.author.name}")
 
 async def setup(bot: commands.Bot):
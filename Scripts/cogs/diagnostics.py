@@ -0,0 +1,186 @@
+import discord
+from discord.ext import commands
+import asyncio
+import logging
+import os
+import tracemalloc
+from typing import Optional
+from utils.memory import cache_counts, compare_extensions, extension_files, format_bytes, peak_rss_bytes, rss_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MESSAGES = 1000  # discord.py's message cache size when none is given
+
+class Diagnostics(commands.Cog):
+    """A cog for inspecting the bot's performance."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        """Check if the user is the bot owner before allowing use of any command in this cog."""
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command(name="cmdstats")
+    async def command_stats(self, ctx: commands.Context, top: int = 15):
+        """
+        Show latency percentiles per command and event-loop lag.
+
+        Usage:
+        .cmdstats [number of commands]
+        """
+        metrics = getattr(self.bot, 'metrics', None)
+        if metrics is None:
+            await ctx.send("Metrics are not enabled.")
+            return
+
+        rows = sorted(metrics.command_latency.items(), key=lambda item: item[1].percentile(95), reverse=True)[:top]
+        lines = [f"{'command':<14}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}{'ext':>8}{'discord':>9}{'err':>5}"]
+        for name, histogram in rows:
+            external = metrics.command_external[name]
+            discord_time = metrics.command_discord[name]
+            lines.append(f"{name[:13]:<14}{histogram.count:>6}"
+                         f"{histogram.percentile(50):>8.2f}{histogram.percentile(95):>8.2f}{histogram.percentile(99):>8.2f}"
+                         f"{external.sum / external.count:>8.2f}{discord_time.sum / discord_time.count:>9.2f}"
+                         f"{metrics.command_errors.get(name, 0):>5}")
+
+        lag = metrics.loop_lag
+        embed = discord.Embed(title="Command Latency (seconds)", color=discord.Color.blue())
+        embed.description = "```\n" + "\n".join(lines) + "\n```" if rows else "No commands recorded yet."
+        embed.add_field(name="Event loop lag",
+                        value=f"p50 {lag.percentile(50) * 1000:.1f}ms, p95 {lag.percentile(95) * 1000:.1f}ms, "
+                              f"p99 {lag.percentile(99) * 1000:.1f}ms",
+                        inline=False)
+        embed.set_footer(text="ext/discord are mean seconds per call spent on external APIs and Discord requests")
+        await ctx.send(embed=embed)
+        logger.info(f"Command stats requested by {ctx.author}")
+
+    @commands.command(name="stalls")
+    async def stalls(self, ctx: commands.Context, action: Optional[str] = None):
+        """
+        Show where the event loop has been blocked, worst call sites first.
+
+        Usage:
+        .stalls        - List the call sites and the stack of the worst one
+        .stalls reset  - Clear the collected stalls
+        """
+        detector = getattr(self.bot, 'stall_detector', None)
+        if detector is None:
+            await ctx.send("The stall detector is not enabled.")
+            return
+
+        if action == "reset":
+            detector.reset()
+            await ctx.send("Stall statistics cleared.")
+            return
+
+        sites = detector.top_sites()
+        if not sites:
+            await ctx.send(f"No event loop stalls over {detector.threshold * 1000:.0f}ms recorded.")
+            return
+
+        embed = discord.Embed(title=f"Event Loop Stalls (> {detector.threshold * 1000:.0f}ms)",
+                              description=f"{detector.stall_count} stalls recorded",
+                              color=discord.Color.orange())
+        for site in sites:
+            embed.add_field(name=site.call_site[:256],
+                            value=f"{site.count}x, total {site.total * 1000:.0f}ms, longest {site.longest * 1000:.0f}ms",
+                            inline=False)
+        stack = "\n".join(sites[0].stack)
+        embed.add_field(name="Stack of the worst call site", value=f"```\n{stack[-1000:]}\n```", inline=False)
+        await ctx.send(embed=embed)
+        logger.info(f"Stall report requested by {ctx.author}")
+
+    @commands.command(name="httpstats")
+    async def http_stats(self, ctx: commands.Context):
+        """
+        Show request counts and latency per host for the shared HTTP client.
+
+        Usage:
+        .httpstats
+        """
+        http_client = getattr(self.bot, 'http_client', None)
+        if http_client is None or not http_client.host_stats:
+            await ctx.send("No outgoing HTTP requests recorded yet.")
+            return
+
+        lines = [f"{'host':<28}{'reqs':>6}{'errs':>6}{'avg ms':>8}{'max ms':>8}"]
+        for host, stats in sorted(http_client.host_stats.items(), key=lambda item: item[1].requests, reverse=True):
+            lines.append(f"{host[:27]:<28}{stats.requests:>6}{stats.errors:>6}"
+                         f"{stats.total_latency / stats.requests * 1000:>8.0f}{stats.max_latency * 1000:>8.0f}")
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+        logger.info(f"HTTP stats requested by {ctx.author}")
+
+    @commands.command(name="memstats")
+    async def memory_stats(self, ctx: commands.Context):
+        """
+        Show the bot's memory use and the size of the discord.py caches.
+
+        Usage:
+        .memstats
+        """
+        snapshots = getattr(self.bot, 'memory_snapshots', {})
+        current = rss_bytes()
+        embed = discord.Embed(title="Memory", color=discord.Color.blue())
+        embed.add_field(name="Cache profile", value=getattr(self.bot, 'cache_profile', 'default'), inline=False)
+        embed.add_field(name="RSS before login", value=format_bytes(snapshots.get('startup')))
+        embed.add_field(name="RSS after ready", value=format_bytes(snapshots.get('ready')))
+        embed.add_field(name="RSS now", value=f"{format_bytes(current)} (peak {format_bytes(peak_rss_bytes())})")
+
+        counts = cache_counts(self.bot)
+        lines = [f"{name:<18}{count:>8}" for name, count in counts.items()]
+        embed.add_field(name="Cached objects", value="```\n" + "\n".join(lines) + "\n```", inline=False)
+        # discord.py has no public accessor for these, so read back what the bot was created with
+        cache_options = getattr(self.bot, 'cache_options', {})
+        max_messages = cache_options.get('max_messages', DEFAULT_MAX_MESSAGES)
+        member_cache_flags = cache_options.get('member_cache_flags') or \
+            discord.MemberCacheFlags.from_intents(self.bot.intents)
+        embed.set_footer(text=f"Message cache limit: {max_messages or 'disabled'}, "
+                              f"member cache: {member_cache_flags!r}")
+        await ctx.send(embed=embed)
+        logger.info(f"Memory stats requested by {ctx.author}")
+
+    @commands.command(name="memreport")
+    async def memory_report(self, ctx: commands.Context, seconds: Optional[float] = None, top: int = 10):
+        """
+        Attribute live allocations to the loaded cogs and show what grew over an interval.
+
+        Usage:
+        .memreport [seconds] [number of lines]
+        """
+        if not tracemalloc.is_tracing():
+            await ctx.send("Allocation tracing is off. Set tracemalloc_frames in [Diagnostics] and restart the bot.")
+            return
+        if seconds is None:
+            seconds = self.bot.config.getfloat('Diagnostics', 'memreport_interval', fallback=30.0)
+
+        status = await ctx.send(f"Taking two allocation snapshots {seconds:.0f}s apart...")
+        before = await asyncio.to_thread(tracemalloc.take_snapshot)
+        await asyncio.sleep(seconds)
+        after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        usage, lines = await asyncio.to_thread(compare_extensions, before, after, extension_files(self.bot), top)
+
+        table = [f"{'cog':<16}{'live KiB':>10}{'diff KiB':>10}{'blocks':>9}"]
+        for item in usage:
+            table.append(f"{item.name.split('.')[-1][:15]:<16}{item.size / 1024:>10.1f}"
+                         f"{item.size_diff / 1024:>+10.1f}{item.count:>9}")
+        embed = discord.Embed(title=f"Memory by cog (over {seconds:.0f}s)", color=discord.Color.blue())
+        embed.description = "```\n" + "\n".join(table) + "\n```"
+
+        growth = []
+        for stat in lines:
+            frame = stat.traceback[0]
+            growth.append(f"{os.path.basename(frame.filename)}:{frame.lineno}  "
+                          f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+} blocks)")
+        if growth:
+            embed.add_field(name="Largest changes", value="```\n" + "\n".join(growth)[:1000] + "\n```", inline=False)
+
+        traced, peak = tracemalloc.get_traced_memory()
+        embed.set_footer(text=f"Traced {format_bytes(traced)} (peak {format_bytes(peak)}), tracemalloc overhead "
+                              f"{format_bytes(tracemalloc.get_tracemalloc_memory())}, "
+                              f"{tracemalloc.get_traceback_limit()} frame(s) per allocation")
+        await status.edit(content=None, embed=embed)
+        logger.info(f"Memory report requested by {ctx.author}")
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Diagnostics(bot))
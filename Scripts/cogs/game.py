@@ -5,21 +5,15 @@ import os
 import sys
 import logging
 import json
-import configparser
-
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+from utils.config import get_config
 
 # Get the cogs directory from config
-cogs_dir = config['Paths']['cogs_folder']
+cogs_dir = get_config().paths.cogs_folder
 
 # Add the 'games' directory to the Python path
 games_dir = os.path.join(cogs_dir, 'games')
 sys.path.append(games_dir)
 
-# Set up logging
-logging.basicConfig(filename=config['Paths']['bot_log_file'], level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Now import the Game class
@@ -37,7 +31,7 @@ class Cog(commands.Cog):
         self.games = {
             "1": ("Ruins of New York", Game)
         }
-        self.highscores_file = os.path.join(cogs_dir, 'json', 'highscores.json')
+        self.highscores_file = os.path.join(get_config().paths.json_folder, 'highscores.json')
         self.highscores = self.load_highscores()
         logger.info("Cog initialized")
 
@@ -142,9 +136,9 @@ class Cog(commands.Cog):
             try:
                 response = await self.bot.wait_for('message', check=check, timeout=300.0)
                 
-                logger.debug(f"Received command from {player}: {response.content}")
+                logger.debug("Received command from %s: %s", player, response.content)
                 output = game.process_command(response.content)
-                logger.debug(f"Game response for {player}: {output}")
+                logger.debug("Game response for %s: %s", player, output)
                 
                 await player.send(output)
                 
@@ -2,7 +2,7 @@ import logging
 import discord
 from discord.ext import commands
 import os
-import configparser
+from utils.config import get_config
 
 logger = logging.getLogger(__name__)
 
@@ -88,10 +88,8 @@ class Game:
         logger.debug(f"Config sections in __init__: {self.config.sections()}")
 
     def load_config(self):
-        config = configparser.ConfigParser()
-        config_path = os.path.expanduser('~/Python/.config')
-        config.read(config_path)
-        return config
+        # Shared with the rest of the bot; parsed once rather than per game
+        return get_config()
 
     def play(self):
         output = []
@@ -140,7 +138,7 @@ class Game:
             return "Please enter a command."
 
         action = command[0]
-        logger.debug(f"Action: {action}")
+        logger.debug("Action: %s", action)
 
         if action in ["go", "move", "walk", "run", "exit", "leave", "enter"]:
             direction = " ".join(command[1:]) if len(command) > 1 else ""
@@ -262,31 +260,31 @@ class Game:
     def go(self, direction):
         logger.info(f"Go method called with direction: {direction}")
         loc = self.locations[self.current_location]
-        logger.debug(f"Current location: {self.current_location}")
-        logger.debug(f"Available exits: {loc['exits']}")
+        logger.debug("Current location: %s", self.current_location)
+        logger.debug("Available exits: %s", loc['exits'])
         
         direction = direction.lower()
         
         # Check for exact match first
         if direction in loc["exits"]:
             new_location = loc["exits"][direction]
-            logger.debug(f"Exact match found. New location: {new_location}")
+            logger.debug("Exact match found. New location: %s", new_location)
         else:
             # If no exact match, look for partial matches
             matching_exits = [exit for exit in loc["exits"].keys() if direction in exit.lower()]
-            logger.debug(f"Matching exits: {matching_exits}")
+            logger.debug("Matching exits: %s", matching_exits)
             if matching_exits:
                 # If there's only one match, use it
                 if len(matching_exits) == 1:
                     new_location = loc["exits"][matching_exits[0]]
-                    logger.debug(f"Single partial match found. New location: {new_location}")
+                    logger.debug("Single partial match found. New location: %s", new_location)
                 else:
                     # If there are multiple matches, check if one contains all words
                     direction_words = direction.split()
                     full_matches = [exit for exit in matching_exits if all(word in exit.lower() for word in direction_words)]
                     if full_matches:
                         new_location = loc["exits"][full_matches[0]]
-                        logger.debug(f"Full partial match found. New location: {new_location}")
+                        logger.debug("Full partial match found. New location: %s", new_location)
                     else:
                         logger.warning(f"Multiple partial matches found, but no full match for: {direction}")
                         return f"Did you mean one of these: {', '.join(matching_exits)}?"
@@ -328,7 +326,7 @@ class Game:
         if loc["items"]:
             output += "You see: " + ", ".join(loc["items"]) + "\n"
         output += "Exits: " + ", ".join(loc["exits"].keys())
-        logger.debug(f"Look output: {output}")
+        logger.debug("Look output: %s", output)
         return output
 
     def show_inventory(self):
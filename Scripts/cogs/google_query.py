@@ -2,46 +2,283 @@ import discord
 from discord.ext import commands
 import aiohttp
 import asyncio
-import configparser
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional, Tuple
 import logging
-from functools import lru_cache
-from datetime import datetime, timedelta
+from utils.cache import SingleFlight, TTLCache
+from utils.config import get_config
+from utils.image_check import ImageLinkChecker
+from utils.metrics import track_external
+from utils.search_cache import QuotaExceeded, SearchStore
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+RESULTS_PER_REQUEST = 10  # what the Custom Search API returns per query
+MAX_START = 91  # the API serves at most the first 100 results
+
+class SearchResultsView(discord.ui.View):
+    """Previous/Next buttons for browsing search results, `per_page` items per page.
+
+    Pages come from the 10 results already fetched; once the reader moves
+    past the first page, the next 10 are prefetched in the background so
+    reaching them doesn't wait on the API. Image links that turn out not to
+    serve an image are skipped. Clicks are handled one at a time, so quick
+    repeated clicks turn one page each.
+    """
+
+    def __init__(self, cog: 'GoogleSearch', author_id: int, query: str, search_type: Optional[str],
+                 results: List[Dict[str, Any]], per_page: int, fetched: Optional[int] = None, timeout: float = 300):
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.author_id = author_id
+        self.query = query
+        self.search_type = search_type
+        self.results = list(results)
+        # Broken images are left out of `results`, so the number fetched from the API is kept separately
+        self.fetched = len(results) if fetched is None else fetched
+        self.per_page = per_page
+        self.page = 0
+        self.exhausted = self.fetched < RESULTS_PER_REQUEST
+        self.message: Optional[discord.Message] = None
+        self.lock = asyncio.Lock()
+        self.update_buttons()
+
+    @property
+    def next_start(self) -> int:
+        return self.fetched + 1
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.results) // self.per_page))
+
+    def has_more(self) -> bool:
+        return not self.exhausted and self.next_start <= MAX_START
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page + 1 >= self.page_count and not self.has_more()
+
+    def page_items(self) -> List[Dict[str, Any]]:
+        return self.results[self.page * self.per_page:(self.page + 1) * self.per_page]
+
+    def embed(self) -> discord.Embed:
+        embed = self.cog.results_embed(self.query, self.search_type, self.page_items())
+        embed.set_footer(text=f"Page {self.page + 1} of {self.page_count}{'+' if self.has_more() else ''}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the person who searched can turn the pages.", ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    async def wait_turn(self, interaction: discord.Interaction):
+        """Defer `interaction` if an earlier click is still being handled, so it doesn't time out waiting."""
+        if self.lock.locked():
+            await interaction.response.defer()
+
+    async def show_page(self, interaction: discord.Interaction):
+        self.update_buttons()
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=self.embed(), view=self)
+        else:
+            await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Previous", emoji="\N{BLACK LEFT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.wait_turn(interaction)
+        async with self.lock:
+            self.page = max(0, self.page - 1)
+            await self.show_page(interaction)
+
+    @discord.ui.button(label="Next", emoji="\N{BLACK RIGHT-POINTING TRIANGLE}", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.wait_turn(interaction)
+        async with self.lock:
+            if (self.page + 1) * self.per_page >= len(self.results) and self.has_more():
+                start = self.next_start
+                if not interaction.response.is_done() and \
+                        self.cog.cache_key(self.query, self.search_type, start) not in self.cog.results_cache:
+                    # Not prefetched (yet): let Discord know this may take a moment
+                    await interaction.response.defer()
+                try:
+                    more = await self.cog.cached_search(self.query, self.search_type, start=start)
+                except QuotaExceeded:
+                    more = []
+                    await interaction.followup.send("I've used up today's Google searches, so there are no more "
+                                                    "pages for now.", ephemeral=True)
+                if start == self.next_start:  # nothing else added these results meanwhile
+                    self.results.extend(more)
+                    self.fetched += len(more)
+                    self.exhausted = len(more) < RESULTS_PER_REQUEST
+            if (self.page + 1) * self.per_page < len(self.results):
+                self.page += 1
+            if self.search_type == 'image':
+                if not interaction.response.is_done() and \
+                        self.cog.image_checker.known(self.results[self.page]['link']) is None:
+                    await interaction.response.defer()
+                await self.skip_broken_images()
+            await self.show_page(interaction)
+            if self.has_more():
+                self.cog.prefetch(self.query, self.search_type, self.next_start)
+
+    async def skip_broken_images(self):
+        """Drop images that don't load from the current page onwards, falling back to the last one that does."""
+        while self.page < len(self.results) and \
+                not await self.cog.image_checker.is_image(self.results[self.page]['link']):
+            del self.results[self.page]
+        self.page = max(0, min(self.page, len(self.results) - 1))
 
 class GoogleSearch(commands.Cog):
     """A cog for performing Google searches."""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.config = get_config()
+        self.apply_config(self.config)
+        self.config.subscribe('Google', self.apply_config)
+        self.base_url = 'https://www.googleapis.com/customsearch/v1'
+        self.results_cache = TTLCache(self.cache_size, self.cache_ttl)
+        self.in_flight = SingleFlight()
+        self.lookup_stats = {"disk_hits": 0, "stale": 0, "refreshed": 0, "rejected": 0, "prefetched": 0}
+        self.background_tasks = set()
+        self.image_checker = ImageLinkChecker(lambda: self.bot.http_client.session, self.image_check_timeout)
+
+    async def cog_load(self):
+        self.store = SearchStore(self.cache_db)
+        await self.store.open()
+        pruned = await self.store.prune(self.cache_ttl + self.stale_ttl)
+        logger.info(f"Opened search cache {self.cache_db} ({pruned} expired results removed, "
+                    f"{self.store.used_today}/{self.daily_quota} queries used today)")
+
+    async def cog_unload(self):
+        self.config.unsubscribe('Google', self.apply_config)
+        for task in list(self.background_tasks):
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        # The searches themselves run shielded and would otherwise write to the closed store
+        await self.in_flight.cancel_all()
+        await self.store.close()
+
+    def apply_config(self, config):
+        """Pick up the API credentials, also called when [Google] changes on disk."""
         self.api_key = os.environ.get('GOOGLE_API_KEY') or config['Google']['API-KEY']
         self.search_engine_id = config['Google']['ENGINE_ID']
-        self.base_url = 'https://www.googleapis.com/customsearch/v1'
-        self.session = None
-        self.cache_ttl = timedelta(hours=1)  # Cache results for 1 hour
-
-    def cog_unload(self):
-        """Clean up the aiohttp session when the cog is unloaded."""
-        if self.session:
-            asyncio.create_task(self.session.close())
-
-    async def get_session(self) -> aiohttp.ClientSession:
-        """Create or return an existing aiohttp ClientSession."""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-        return self.session
-
-    @lru_cache(maxsize=100)
-    async def cached_search(self, query: str, search_type: str = None) -> List[Dict[str, Any]]:
-        """Perform a cached Google search."""
+        self.cache_ttl = config.getfloat('Google', 'cache_ttl', fallback=3600.0)
+        self.cache_size = config.getint('Google', 'cache_size', fallback=100)
+        self.stale_ttl = config.getfloat('Google', 'stale_ttl', fallback=7 * 86400.0)
+        self.daily_quota = config.getint('Google', 'daily_quota', fallback=100)
+        self.quota_reserve = config.getint('Google', 'quota_reserve', fallback=10)
+        self.cache_db = config.get('Google', 'cache_db', fallback=os.path.join(config.paths.json_folder, 'search_cache.db'))
+        self.image_check_timeout = config.getfloat('Google', 'image_check_timeout', fallback=3.0)
+        if hasattr(self, 'image_checker'):
+            self.image_checker.timeout = aiohttp.ClientTimeout(total=self.image_check_timeout)
+        if hasattr(self, 'results_cache'):
+            self.results_cache.ttl = self.cache_ttl
+            self.results_cache.maxsize = self.cache_size
+
+    @staticmethod
+    def cache_key(query: str, search_type: Optional[str], start: int = 1) -> Tuple[str, str, int]:
+        return " ".join(query.casefold().split()), search_type or '', start
+
+    async def cached_search(self, query: str, search_type: str = None, start: int = 1) -> List[Dict[str, Any]]:
+        """Perform a Google search, reusing results for the same query for `cache_ttl` seconds.
+        `start` is the 1-based index of the first of the 10 results to return.
+
+        Raises QuotaExceeded when the API would be needed but today's queries are used up.
+        """
+        key = self.cache_key(query, search_type, start)
+        results = self.results_cache.get(key)
+        if results is not None:
+            return results
+        # Concurrent identical searches share one lookup
+        results, _ = await self.in_flight.do(key, lambda: self.lookup(key))
+        return results
+
+    async def lookup(self, key: Tuple[str, str, int]) -> List[Dict[str, Any]]:
+        """Results from the disk cache when they are fresh enough, otherwise from the API."""
+        stored = await self.store.get(*key)
+        age = time.time() - stored[0] if stored else None
+        if stored and age < self.cache_ttl:
+            self.lookup_stats["disk_hits"] += 1
+            self.results_cache.set(key, stored[1], ttl=self.cache_ttl - age)
+            return stored[1]
+
+        remaining = self.daily_quota - await self.store.queries_today()
+        if stored and (age < self.cache_ttl + self.stale_ttl or remaining <= self.quota_reserve):
+            # Stale-while-revalidate: answer with the old results and refresh them while quota is left.
+            # Close to the quota, old results of any age are better than spending the last queries.
+            self.lookup_stats["stale"] += 1
+            if remaining > self.quota_reserve:
+                self.refresh_in_background(key)
+            return stored[1]
+
+        if remaining <= 0:
+            self.lookup_stats["rejected"] += 1
+            raise QuotaExceeded(f"All {self.daily_quota} searches for today have been used")
+        results = await self.search(key)
+        if results is None:
+            return stored[1] if stored else []
+        return results
+
+    def refresh_in_background(self, key: Tuple[str, str, int]):
+        refresh_key = ('refresh',) + key
+        if self.in_flight.in_flight(refresh_key):
+            return
+
+        async def refresh():
+            if await self.search(key) is not None:
+                self.lookup_stats["refreshed"] += 1
+
+        self.run_in_background(self.in_flight.do(refresh_key, refresh))
+
+    def prefetch(self, query: str, search_type: Optional[str], start: int):
+        """Load a further page of results in the background, as long as that doesn't eat into the quota reserve."""
+        key = self.cache_key(query, search_type, start)
+        if key in self.results_cache or self.in_flight.in_flight(key):
+            return
+        if self.daily_quota - self.store.used_today <= self.quota_reserve:
+            return
+
+        async def load():
+            # Other cluster processes may have used the quota since it was last read
+            if self.daily_quota - await self.store.queries_today() <= self.quota_reserve:
+                return
+            self.lookup_stats["prefetched"] += 1
+            try:
+                results = await self.cached_search(query, search_type, start)
+            except QuotaExceeded:
+                return
+            if search_type == 'image':
+                # Check the new links too, so turning to them doesn't wait either
+                await asyncio.gather(*(self.image_checker.is_image(item['link']) for item in results))
+
+        self.run_in_background(load())
+
+    def run_in_background(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def search(self, key: Tuple[str, str, int]) -> Optional[List[Dict[str, Any]]]:
+        """Query the Custom Search API and cache the results. Returns None on errors, which are not cached."""
+        query, search_type, start = key
+        await self.store.count_query()
+        results = await self.fetch(query, search_type or None, start)
+        if results is not None:
+            self.results_cache.set(key, results)
+            await self.store.put(query, search_type, start, results)
+        return results
+
+    async def fetch(self, query: str, search_type: Optional[str], start: int = 1) -> Optional[List[Dict[str, Any]]]:
         params = {
             'key': self.api_key,
             'cx': self.search_engine_id,
@@ -49,56 +286,88 @@ class GoogleSearch(commands.Cog):
         }
         if search_type:
             params['searchType'] = search_type
+        if start > 1:
+            params['start'] = start
 
-        session = await self.get_session()
         try:
-            async with session.get(self.base_url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('items', [])
-                else:
-                    logger.error(f"Google API error: {response.status} - {await response.text()}")
-                    return []
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error during Google search: {str(e)}")
-            return []
+            with track_external():
+                async with self.bot.http_client.session.get(self.base_url, params=params) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data.get('items', [])
+                    else:
+                        logger.error(f"Google API error: {response.status} - {await response.text()}")
+                        return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Network error during Google search: {e!r}")
+            return None
+
+    @staticmethod
+    def results_embed(query: str, search_type: Optional[str], items: List[Dict[str, Any]]) -> discord.Embed:
+        if search_type == 'image':
+            embed = discord.Embed(title=f"Image Search Result for '{query}'", color=discord.Color.green())
+            embed.set_image(url=items[0]['link'])
+            return embed
+        response = "\n\n".join([f"**{item['title']}**\n{item.get('snippet', '')}\n{item['link']}" for item in items])
+        return discord.Embed(title=f"Google Search Results for '{query}'", description=response, color=discord.Color.blue())
+
+    async def send_results(self, ctx: commands.Context, query: str, search_type: Optional[str], per_page: int):
+        await ctx.typing()
+        results = await self.cached_search(query, search_type)
+        fetched = len(results)
+        if results and search_type == 'image':
+            # Show the first link that really serves an image, and leave out the ones known not to
+            checker = self.image_checker
+            first = await checker.first_image(item['link'] for item in results)
+            results = [] if first is None else sorted(
+                (item for item in results if checker.known(item['link']) is not False),
+                key=lambda item: item['link'] != first)
+        if not results:
+            kind = "image" if search_type == 'image' else "results"
+            embed = discord.Embed(title="No Results", description=f"No {kind} found for '{query}'", color=discord.Color.red())
+            await ctx.send(embed=embed)
+            return
+
+        view = SearchResultsView(self, ctx.author.id, query, search_type, results, per_page, fetched)
+        view.message = await ctx.send(embed=view.embed(), view=view)
 
     @commands.command(name="google")
     async def google(self, ctx: commands.Context, *, query: str):
         """
-        Perform a Google search and return the top 3 results.
+        Perform a Google search and show the results 3 at a time, with buttons to page through them.
 
         Usage:
         !google <query>
         """
-        await ctx.typing()
-        results = await self.cached_search(query)
-        if results:
-            response = "\n\n".join([f"**{item['title']}**\n{item['snippet']}\n{item['link']}" for item in results[:3]])
-            embed = discord.Embed(title=f"Google Search Results for '{query}'", description=response, color=discord.Color.blue())
-        else:
-            embed = discord.Embed(title="No Results", description=f"No results found for '{query}'", color=discord.Color.red())
-        
-        await ctx.send(embed=embed)
+        await self.send_results(ctx, query, None, per_page=3)
 
     @commands.command(name="image")
     async def image(self, ctx: commands.Context, *, query: str):
         """
-        Perform a Google image search and return the first result.
+        Perform a Google image search and show the results one at a time, with buttons to page through them.
 
         Usage:
         !image <query>
         """
-        await ctx.typing()
-        results = await self.cached_search(query, search_type='image')
-        if results:
-            image_url = results[0]['link']
-            embed = discord.Embed(title=f"Image Search Result for '{query}'", color=discord.Color.green())
-            embed.set_image(url=image_url)
-        else:
-            embed = discord.Embed(title="No Results", description=f"No image found for '{query}'", color=discord.Color.red())
-        
-        await ctx.send(embed=embed)
+        await self.send_results(ctx, query, 'image', per_page=1)
+
+    @commands.command(name="searchstats")
+    async def search_stats(self, ctx: commands.Context):
+        """
+        Show how often searches were answered from the cache.
+
+        Usage:
+        !searchstats
+        """
+        cache = self.results_cache
+        stats = self.lookup_stats
+        await ctx.send(f"Search cache: {len(cache)}/{cache.maxsize} queries in memory, {cache.hit_rate:.0%} hit rate "
+                       f"({cache.hits} hits, {cache.misses} misses, {self.in_flight.shared_calls} shared in flight), "
+                       f"fresh for {cache.ttl / 60:.0f} minutes\n"
+                       f"Disk cache: {stats['disk_hits']} hits, {stats['stale']} stale results served, "
+                       f"{stats['refreshed']} refreshed in the background, {stats['prefetched']} pages prefetched\n"
+                       f"API quota: {self.store.used_today}/{self.daily_quota} queries used today, "
+                       f"{stats['rejected']} searches turned away")
 
     @google.error
     @image.error
@@ -106,6 +375,10 @@ class GoogleSearch(commands.Cog):
         """Error handler for search commands."""
         if isinstance(error, commands.MissingRequiredArgument):
             await ctx.send("Please provide a search query. Usage: `!google <query>` or `!image <query>`")
+        elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, QuotaExceeded):
+            await ctx.send("I've used up today's Google searches and don't have this one saved. "
+                           "Please try again tomorrow.")
+            logger.warning(f"Search by {ctx.author.name} turned away: {error.original}")
         else:
             await ctx.send(f"An error occurred: {str(error)}")
             logger.error(f"Error in search command: {str(error)}")
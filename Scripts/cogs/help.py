@@ -13,7 +13,7 @@ class BotCapabilities(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.hidden_cogs = ["CogManager", "LogViewer", "DnDRecorder"]  # Add any other cogs you want to hide
+        self.hidden_cogs = ["CogManager", "LogViewer", "DnDRecorder", "Diagnostics"]  # Add any other cogs you want to hide
         self.categories: Dict[str, CommandCategory] = self._categorize_commands()
 
     def _categorize_commands(self) -> Dict[str, CommandCategory]:
@@ -1,6 +1,5 @@
 import discord
 from discord.ext import commands
-import aiohttp
 
 class JokePoster(commands.Cog):
     def __init__(self, bot):
@@ -18,12 +17,11 @@ class JokePoster(commands.Cog):
             await ctx.send("Sorry, I couldn't fetch a joke at the moment.")
 
     async def fetch_joke(self):
-        async with aiohttp.ClientSession() as session:
-            async with session.get('https://v2.jokeapi.dev/joke/Any?safe-mode') as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    return None
+        async with self.bot.http_client.session.get('https://v2.jokeapi.dev/joke/Any?safe-mode') as response:
+            if response.status == 200:
+                return await response.json()
+            else:
+                return None
 
 async def setup(bot):
     await bot.add_cog(JokePoster(bot))
\ No newline at end of file
@@ -1,52 +1,200 @@
 import discord
 from discord.ext import commands
-import os
-import configparser
-from io import StringIO
+import asyncio
+import gzip
+import re
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+from utils.config import get_config
+from utils.live_message import MESSAGE_LIMIT, LiveMessage
+from utils.log_follow import EntryFilter, LogFollower
+from utils.log_tail import LEVELS, search_logs, tail_lines
+from io import BytesIO
 
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+DEFAULT_LINES = 25
+MAX_LINES = 20000
+COMPRESS_OVER = 512 * 1024  # attachments bigger than this are sent gzipped
+MAX_FOLLOW_MINUTES = 60
+FOLLOW_EDIT_INTERVAL = 2.0  # seconds between edits of a followed log message
 
 class LogViewer(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot_log_file = config['Paths']['bot_log_file']
-        self.script_runner_log_file = config['Paths']['log_file']
+        self.config = get_config()
+        self.followers: Dict[str, LogFollower] = {}  # log file -> follower
 
-    def get_last_25_lines(self, log_file):
-        with open(log_file, 'r') as file:
-            lines = file.readlines()
-            last_25_lines = lines[-25:]
-        return ''.join(last_25_lines)
+    def cog_unload(self):
+        for follower in self.followers.values():
+            follower.stop()
 
-    @commands.command(name="botlog")
-    @commands.is_owner()
-    async def view_bot_log(self, ctx):
-        """View the last 25 lines of bot.log"""
-        logs = self.get_last_25_lines(self.bot_log_file)
-       
-        if len(logs) > 2000:
+    @property
+    def bot_log_file(self):
+        # Each cluster process writes its own log (see cluster_path in discord_bot.py)
+        return getattr(self.bot, 'log_file', self.config.paths.bot_log_file)
+
+    @property
+    def script_runner_log_file(self):
+        return self.config.paths.log_file
+
+    @staticmethod
+    def parse_options(args: Sequence[str], default: int = DEFAULT_LINES,
+                      maximum: int = MAX_LINES) -> Tuple[int, Optional[Pattern], Optional[str]]:
+        """Parse `[N] [grep <pattern>] [level]` in any order."""
+        count, pattern, level = default, None, None
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg.isdigit():
+                count = max(1, min(int(arg), maximum))
+            elif arg.lower() == 'grep' and args:
+                try:
+                    pattern = re.compile(args.pop(0), re.IGNORECASE)
+                except re.error as e:
+                    raise commands.BadArgument(f"Invalid grep pattern: {e}")
+            elif arg.upper() in LEVELS:
+                level = arg.upper()
+            else:
+                raise commands.BadArgument(f"Unknown option `{arg}`. Usage: `[N] [grep <pattern>] [level]`")
+        return count, pattern, level
+
+    def read_log(self, log_file: str, count: int, pattern: Optional[Pattern], level: Optional[str]) -> str:
+        if pattern is None and level is None:
+            return ''.join(tail_lines(log_file, count))
+        return ''.join(search_logs(log_file, count, pattern, level))
+
+    async def send_log(self, ctx, log_file: str, name: str, label: str, args: Sequence[str]):
+        try:
+            count, pattern, level = self.parse_options(args)
+        except commands.BadArgument as e:
+            await ctx.send(str(e))
+            return
+
+        try:
+            # The logs can be hundreds of MB; reading them must not block the event loop
+            logs = await asyncio.to_thread(self.read_log, log_file, count, pattern, level)
+        except FileNotFoundError:
+            await ctx.send(f"{log_file} does not exist.")
+            return
+
+        filters = []
+        if pattern is not None:
+            filters.append(f"matching `{pattern.pattern}`")
+        if level is not None:
+            filters.append(f"at {level} or above")
+        what = " ".join([f"the last {count} {'entries' if filters else 'lines'} of {label} logs"] + filters)
+        if not logs:
+            await ctx.send(f"Nothing found in {what}.")
+        elif len(logs) > 1990:
             # If the log is too long, send it as a file
-            buffer = StringIO(logs)
-            file = discord.File(buffer, filename="bot_last_25_lines.log")
-            await ctx.send("Here are the last 25 lines of bot logs:", file=file)
+            data = logs.encode('utf-8')
+            filename = f"{name}_last_{count}_lines.log"
+            if len(data) > COMPRESS_OVER:
+                data = await asyncio.to_thread(gzip.compress, data)
+                filename += '.gz'
+            await ctx.send(f"Here are {what}:", file=discord.File(BytesIO(data), filename=filename))
         else:
             await ctx.send(f"```\n{logs}\n```")
 
+    async def follow_log(self, ctx, log_file: str, label: str, command: str, args: Sequence[str]):
+        """Stream new lines of `log_file` into a message that is edited every couple of seconds."""
+        default_minutes = self.config.getint('Logging', 'follow_minutes', fallback=10)
+        try:
+            minutes, pattern, level = self.parse_options(args, default=default_minutes, maximum=MAX_FOLLOW_MINUTES)
+        except commands.BadArgument as e:
+            await ctx.send(str(e))
+            return
+        max_messages = self.config.getint('Logging', 'follow_max_messages', fallback=10)
+
+        previous = self.followers.get(log_file)
+        if previous is not None:
+            previous.stop()
+
+        message = await ctx.send(f"Following the {label} log for {minutes} minute{'s' if minutes != 1 else ''} "
+                                 f"(`.{command} stop` to stop early)...")
+        # Log lines can contain anything, including @everyone and role or user mentions
+        reply = LiveMessage(message, interval=FOLLOW_EDIT_INTERVAL, allowed_mentions=discord.AllowedMentions.none())
+        reply.set_text(message.content + "\n")
+        show = EntryFilter(pattern, level)
+        # Pages break at line ends, so allow for a partly filled page each, and for the closing note
+        max_chars = max_messages * (MESSAGE_LIMIT - 200)
+        follower = None
+        full = False
+
+        def on_lines(lines: List[str]):
+            nonlocal full
+            for line in lines:
+                if not show(line):
+                    continue
+                line = discord.utils.escape_markdown(line) + "\n"
+                if len(reply.text) + len(line) > max_chars:
+                    full = True
+                    follower.stop()
+                    return
+                reply.append(line)
+
+        follower = LogFollower(log_file, on_lines)
+        self.followers[log_file] = follower
+        stopped = None
+        try:
+            stopped = await follower.run(minutes * 60)
+        finally:
+            if self.followers.get(log_file) is follower:
+                del self.followers[log_file]
+            if stopped is None:
+                reason = "something went wrong"
+            elif stopped and full:
+                reason = f"reached the limit of {max_messages} message{'s' if max_messages != 1 else ''}"
+            elif stopped:
+                reason = "stopped"
+            else:
+                reason = "time is up"
+            # Always ends the message's background edits, also when following failed
+            await reply.finish(f"(No longer following the {label} log: {reason}.)")
+
+    async def stop_following(self, ctx, log_file: str, label: str):
+        follower = self.followers.get(log_file)
+        if follower is None:
+            await ctx.send(f"The {label} log isn't being followed.")
+        else:
+            follower.stop()
+
+    @commands.command(name="botlog")
+    @commands.is_owner()
+    async def view_bot_log(self, ctx, *args: str):
+        """
+        View the end of bot.log, optionally filtered by text and level (rotated logs are searched too),
+        or follow new lines live for a number of minutes.
+
+        Usage:
+        .botlog [N] [grep <pattern>] [level]
+        .botlog follow [minutes] [grep <pattern>] [level]
+        .botlog stop
+        Example: .botlog 50 grep "timed out" warning
+        """
+        if args and args[0].lower() == 'follow':
+            await self.follow_log(ctx, self.bot_log_file, "bot", "botlog", args[1:])
+        elif args and args[0].lower() == 'stop':
+            await self.stop_following(ctx, self.bot_log_file, "bot")
+        else:
+            await self.send_log(ctx, self.bot_log_file, "bot", "bot", args)
+
     @commands.command(name="scriptlog")
     @commands.is_owner()
-    async def view_script_runner_log(self, ctx):
-        """View the last 25 lines of script_runner.log"""
-        logs = self.get_last_25_lines(self.script_runner_log_file)
-       
-        if len(logs) > 2000:
-            # If the log is too long, send it as a file
-            buffer = StringIO(logs)
-            file = discord.File(buffer, filename="script_runner_last_25_lines.log")
-            await ctx.send("Here are the last 25 lines of script runner logs:", file=file)
+    async def view_script_runner_log(self, ctx, *args: str):
+        """
+        View the end of script_runner.log, optionally filtered by text and level,
+        or follow new lines live for a number of minutes.
+
+        Usage:
+        .scriptlog [N] [grep <pattern>] [level]
+        .scriptlog follow [minutes] [grep <pattern>] [level]
+        .scriptlog stop
+        """
+        if args and args[0].lower() == 'follow':
+            await self.follow_log(ctx, self.script_runner_log_file, "script runner", "scriptlog", args[1:])
+        elif args and args[0].lower() == 'stop':
+            await self.stop_following(ctx, self.script_runner_log_file, "script runner")
         else:
-            await ctx.send(f"```\n{logs}\n```")
+            await self.send_log(ctx, self.script_runner_log_file, "script_runner", "script runner", args)
 
     @commands.command(name="rmbot")
     @commands.is_owner()
@@ -3,31 +3,33 @@ from discord.ext import commands
 import os
 import logging
 import asyncio
-from typing import Optional
-import configparser
+import time
+from typing import List, Optional
+from utils.config import get_config
+from utils.extensions import run_extension_op
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+config = get_config()
+
+MANAGER_COG = __name__.split('.')[-1]
 
 class CogManager(commands.Cog):
     """A cog for managing other cogs (loading, unloading, reloading)."""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.cogs_dir = config['Paths']['cogs_folder']
+        self.cogs_dir = config.paths.cogs_folder
 
     async def cog_check(self, ctx: commands.Context) -> bool:
         """Check if the user is the bot owner before allowing use of any command in this cog."""
         return await self.bot.is_owner(ctx.author)
 
-    async def confirm_action(self, ctx: commands.Context, action: str, cog_name: str) -> bool:
+    async def confirm_action(self, ctx: commands.Context, action: str, cog_names: List[str]) -> bool:
         """Ask for confirmation before performing a critical action."""
-        confirm_message = await ctx.send(f"Are you sure you want to {action} the cog `{cog_name}`? (yes/no)")
+        target = f"the cog `{cog_names[0]}`" if len(cog_names) == 1 else \
+            f"the cogs {', '.join(f'`{name}`' for name in cog_names)}"
+        confirm_message = await ctx.send(f"Are you sure you want to {action} {target}? (yes/no)")
         
         def check(m):
             return m.author == ctx.author and m.channel == ctx.channel and m.content.lower() in ['yes', 'no']
@@ -44,77 +46,118 @@ class CogManager(commands.Cog):
 
         return True
 
+    def available_cogs(self) -> List[str]:
+        return sorted(f[:-3] for f in os.listdir(self.cogs_dir) if f.endswith('.py'))
+
+    def loaded_cogs(self) -> List[str]:
+        return sorted(ext.split('.')[-1] for ext in self.bot.extensions)
+
+    def resolve_cogs(self, action: str, cogs: str) -> List[str]:
+        """Turn `all` or a comma-separated list into cog names."""
+        if cogs.lower() != 'all':
+            return list(dict.fromkeys(name.strip() for name in cogs.split(',') if name.strip()))
+        if action == 'load':
+            return [cog for cog in self.available_cogs() if cog not in self.loaded_cogs()]
+        if action == 'unload':
+            # Unloading this cog would take the commands to load them back with it
+            return [cog for cog in self.loaded_cogs() if cog != MANAGER_COG]
+        return self.loaded_cogs()
+
+    async def run_batch(self, ctx: commands.Context, action: str, cogs: str):
+        """Confirm once, then load/unload/reload the cogs concurrently and report the timings."""
+        cog_names = self.resolve_cogs(action, cogs)
+        if not cog_names:
+            await ctx.send(f"There are no cogs to {action}.")
+            return
+        if not await self.confirm_action(ctx, action, cog_names):
+            return
+
+        async def run(cog: str):
+            try:
+                return cog, await run_extension_op(self.bot, action, f'cogs.{cog}'), None
+            except Exception as e:
+                logger.error(f"Error {action}ing cog '{cog}': {str(e)}")
+                return cog, None, e
+
+        # Different extensions don't share state, so their (async) setup and teardown can
+        # overlap. This cog goes last so the batch isn't torn down halfway through.
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run(cog) for cog in cog_names if cog != MANAGER_COG))
+        if MANAGER_COG in cog_names:
+            results.append(await run(MANAGER_COG))
+        total = time.perf_counter() - start
+
+        lines = []
+        for cog, elapsed, error in results:
+            if error is None:
+                lines.append(f"{cog:<16}{action}ed in {elapsed:.2f}s")
+            else:
+                lines.append(f"{cog:<16}failed: {str(error)[:150]}")
+        succeeded = [cog for cog, _, error in results if error is None]
+        await ctx.send(f"{action.capitalize()}ed {len(succeeded)}/{len(results)} cogs in {total:.2f}s\n"
+                       "```\n" + "\n".join(lines) + "\n```")
+        if succeeded:
+            logger.info(f"Cogs {', '.join(succeeded)} {action}ed by {ctx.author} in {total:.2f}s")
+
     @commands.command()
-    async def load(self, ctx: commands.Context, cog: str):
+    async def load(self, ctx: commands.Context, cogs: str):
         """
-        Load a cog.
+        Load one or more cogs.
 
         Usage:
         !load <cog_name>
+        !load <cog_name>,<cog_name>,...
+        !load all
         """
-        if not await self.confirm_action(ctx, "load", cog):
-            return
-
-        try:
-            await self.bot.load_extension(f'cogs.{cog}')
-            await ctx.send(f'Cog `{cog}` has been loaded.')
-            logger.info(f"Cog '{cog}' loaded by {ctx.author}")
-        except Exception as e:
-            await ctx.send(f'Failed to load cog `{cog}`. Error: {str(e)}')
-            logger.error(f"Error loading cog '{cog}': {str(e)}")
+        await self.run_batch(ctx, "load", cogs)
 
     @commands.command()
-    async def unload(self, ctx: commands.Context, cog: str):
+    async def unload(self, ctx: commands.Context, cogs: str):
         """
-        Unload a cog.
+        Unload one or more cogs.
 
         Usage:
         !unload <cog_name>
+        !unload <cog_name>,<cog_name>,...
+        !unload all
         """
-        if not await self.confirm_action(ctx, "unload", cog):
-            return
-
-        try:
-            await self.bot.unload_extension(f'cogs.{cog}')
-            await ctx.send(f'Cog `{cog}` has been unloaded.')
-            logger.info(f"Cog '{cog}' unloaded by {ctx.author}")
-        except Exception as e:
-            await ctx.send(f'Failed to unload cog `{cog}`. Error: {str(e)}')
-            logger.error(f"Error unloading cog '{cog}': {str(e)}")
+        await self.run_batch(ctx, "unload", cogs)
 
     @commands.command()
-    async def reload(self, ctx: commands.Context, cog: str):
+    async def reload(self, ctx: commands.Context, cogs: str):
         """
-        Reload a cog.
+        Reload one or more cogs.
 
         Usage:
         !reload <cog_name>
+        !reload <cog_name>,<cog_name>,...
+        !reload all
         """
-        if not await self.confirm_action(ctx, "reload", cog):
-            return
-
-        try:
-            await self.bot.reload_extension(f'cogs.{cog}')
-            await ctx.send(f'Cog `{cog}` has been reloaded.')
-            logger.info(f"Cog '{cog}' reloaded by {ctx.author}")
-        except Exception as e:
-            await ctx.send(f'Failed to reload cog `{cog}`. Error: {str(e)}')
-            logger.error(f"Error reloading cog '{cog}': {str(e)}")
+        await self.run_batch(ctx, "reload", cogs)
 
     @commands.command()
     async def list_cogs(self, ctx: commands.Context):
         """
-        List all available cogs and their status.
+        List all available cogs, their status, load time and last reload.
 
         Usage:
         !list_cogs
         """
-        cogs = [f[:-3] for f in os.listdir(self.cogs_dir) if f.endswith('.py')]
-        loaded_cogs = [ext.split('.')[-1] for ext in self.bot.extensions]
+        loaded_cogs = self.loaded_cogs()
+        timings = getattr(self.bot, 'extension_timings', {})
         
         embed = discord.Embed(title="Cog Status", color=discord.Color.blue())
-        for cog in cogs:
-            status = "Loaded" if cog in loaded_cogs else "Unloaded"
+        for cog in self.available_cogs():
+            if cog not in loaded_cogs:
+                embed.add_field(name=cog, value="Unloaded", inline=False)
+                continue
+            timing = timings.get(f'cogs.{cog}')
+            if timing is None:
+                embed.add_field(name=cog, value="Loaded", inline=False)
+                continue
+            status = f"Loaded {discord.utils.format_dt(timing.loaded_at, 'R')} in {timing.load_seconds:.2f}s"
+            if timing.reloaded_at is not None:
+                status += f", last reload {discord.utils.format_dt(timing.reloaded_at, 'R')}"
             embed.add_field(name=cog, value=status, inline=False)
         
         await ctx.send(embed=embed)
@@ -124,7 +167,7 @@ class CogManager(commands.Cog):
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
         """Global error handler for command errors."""
         if isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send(f"Missing required argument. Usage: `{ctx.prefix}{ctx.command.name} <cog_name>`")
+            await ctx.send(f"Missing required argument. Usage: `{ctx.prefix}{ctx.command.name} <cog_name>[,<cog_name>...]|all`")
         elif isinstance(error, commands.NotOwner):
             await ctx.send("You must be the bot owner to use this command.")
         else:
@@ -1,28 +1,32 @@
 import discord
 from discord.ext import commands, tasks
-import yt_dlp
 import asyncio
-import configparser
-import os
 import random
+import re
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import time
 import logging
+from utils.config import get_config
+from utils.metrics import track_external
+from utils.workers import WorkerProcess
 
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+config = get_config()
 
-# Set up YouTube API client
+# YouTube Data API settings
 DEVELOPER_KEY = config['Youtube']['API-KEY']
 YOUTUBE_API_SERVICE_NAME = "youtube"
 YOUTUBE_API_VERSION = "v3"
-youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=DEVELOPER_KEY)
+YOUTUBE_BATCH_SIZE = 50  # videos.list accepts at most 50 IDs per call
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v="
 
 # YouTube Premium account credentials
 EMAIL = config['Youtube']['Email']
 PASSWORD = config['Youtube']['Password']
 
+# yt-dlp runs in a supervised worker process (see utils/media_tasks.py)
+media_worker = WorkerProcess('music', 'utils.media_tasks')
+
 # yt-dlp options
 ydl_opts = {
     'format': 'bestaudio/best',
@@ -35,10 +39,6 @@ ydl_opts = {
     'password': PASSWORD,
 }
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='.', intents=intents)
-
 # Add this line
 discord.utils.setup_logging(level=logging.INFO, root=False)
 
@@ -53,21 +53,117 @@ async def retry_with_backoff(func, max_retries=3, base_delay=1):
             print(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {delay:.2f} seconds...")
             await asyncio.sleep(delay)
 
-async def search_youtube(query):
+_youtube = None
+_youtube_lock = asyncio.Lock()
+
+def get_youtube_client():
+    """Build the YouTube Data API client on first use.
+
+    The discovery document is loaded from the copy bundled with
+    google-api-python-client instead of being fetched over the network.
+    """
+    global _youtube
+    if _youtube is None:
+        _youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=DEVELOPER_KEY,
+                         static_discovery=True, cache_discovery=False)
+    return _youtube
+
+async def youtube_api_call(request_factory):
+    # The client is synchronous and its httplib2 transport is not thread-safe,
+    # so calls are serialized and executed off the event loop.
+    with track_external():
+        async with _youtube_lock:
+            return await asyncio.to_thread(lambda: request_factory(get_youtube_client()).execute())
+
+def parse_duration(duration):
+    """Convert an ISO 8601 duration such as 'PT1H4M13S' to seconds."""
+    match = re.fullmatch(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?', duration or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?:??"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+async def fetch_video_details(video_ids):
+    """Look up titles and durations for video IDs, 50 per videos.list call.
+
+    Videos that are private, deleted or otherwise unavailable are not
+    returned by the API and are therefore dropped from the result.
+    """
+    details = {}
+    for start in range(0, len(video_ids), YOUTUBE_BATCH_SIZE):
+        batch = video_ids[start:start + YOUTUBE_BATCH_SIZE]
+        response = await youtube_api_call(lambda yt: yt.videos().list(
+            part='snippet,contentDetails',
+            id=','.join(batch),
+            maxResults=YOUTUBE_BATCH_SIZE,
+        ))
+        for item in response.get('items', []):
+            details[item['id']] = {
+                'id': item['id'],
+                'title': item['snippet']['title'],
+                'duration': parse_duration(item['contentDetails'].get('duration')),
+                'webpage_url': f"{YOUTUBE_WATCH_URL}{item['id']}",
+                'url': None,
+            }
+    return [details[video_id] for video_id in video_ids if video_id in details]
+
+async def resolve_stream_url(webpage_url):
+    """Resolve the direct audio stream URL for a single video with yt-dlp."""
+    stream_opts = ydl_opts.copy()
+    stream_opts.update({
+        'no_warnings': True,
+        'quiet': True,
+    })
+
+    with track_external():
+        return await retry_with_backoff(lambda: media_worker.call('resolve_stream_url', webpage_url, stream_opts))
+
+async def search_youtube_ytdlp(query):
     search_opts = ydl_opts.copy()
     search_opts.update({
         'default_search': 'ytsearch',
         'no_warnings': True,
         'quiet': True
     })
-    
-    async def search():
-        with yt_dlp.YoutubeDL(search_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch:{query}", download=False)['entries'][0]
-            return {'url': info['url'], 'title': info['title']}
+
+    with track_external():
+        return await retry_with_backoff(lambda: media_worker.call('search', query, search_opts))
+
+async def search_youtube(query):
+    """Find the best match for a query.
+
+    Uses search.list plus a batched videos.list lookup; the stream URL is only
+    resolved with yt-dlp once the song is about to play. Falls back to a
+    yt-dlp search if the Data API is unavailable (e.g. quota exhausted).
+    """
+    try:
+        response = await youtube_api_call(lambda yt: yt.search().list(
+            q=query,
+            part='id',
+            type='video',
+            maxResults=5,
+        ))
+        video_ids = [item['id']['videoId'] for item in response.get('items', [])]
+        videos = await fetch_video_details(video_ids)
+        if videos:
+            return videos[0]
+    except HttpError as e:
+        logging.warning(f"YouTube Data API search failed, falling back to yt-dlp: {e}")
+    except Exception as e:
+        # Network errors, timeouts or an unexpected response shape; yt-dlp may still find it
+        logging.warning(f"YouTube Data API search failed, falling back to yt-dlp: {e!r}", exc_info=True)
 
     try:
-        return await retry_with_backoff(search)
+        return await search_youtube_ytdlp(query)
     except Exception as e:
         print(f"An error occurred in search_youtube: {str(e)}")
         import traceback
@@ -83,8 +179,12 @@ class Music(commands.Cog):
         self.last_member_time = {}
         self.check_inactivity.start()
 
-    def cog_unload(self):
+    async def cog_load(self):
+        await media_worker.start()
+
+    async def cog_unload(self):
         self.check_inactivity.cancel()
+        await media_worker.stop()
 
     def reset_activity_timer(self, guild_id):
         self.last_activity[guild_id] = time.time()
@@ -100,6 +200,11 @@ class Music(commands.Cog):
 
     @tasks.loop(seconds=60)
     async def check_inactivity(self):
+        # Voice state is unreliable while the gateway is reconnecting; wait it out
+        monitor = getattr(self.bot, 'connection_monitor', None)
+        if monitor and not monitor.is_stable():
+            return
+
         for guild_id in list(self.last_activity.keys()):
             guild = self.bot.get_guild(guild_id)
             if guild and guild.voice_client:
@@ -160,7 +265,7 @@ class Music(commands.Cog):
 
         songs_added = 0
         for song_info in song_infos:
-            if song_info and 'url' in song_info and 'title' in song_info:
+            if song_info and 'title' in song_info and (song_info.get('url') or song_info.get('webpage_url')):
                 if ctx.guild.id not in self.queue:
                     self.queue[ctx.guild.id] = []
                 self.queue[ctx.guild.id].append(song_info)
@@ -185,6 +290,8 @@ class Music(commands.Cog):
             song = self.queue[ctx.guild.id].pop(0)
             self.current_song[ctx.guild.id] = song
             try:
+                if not song.get('url'):
+                    song['url'] = await resolve_stream_url(song['webpage_url'])
                 ctx.voice_client.play(discord.FFmpegPCMAudio(song['url'], before_options="-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"), 
                                       after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop))
                 await ctx.send(f"Now playing: {song['title']}")
@@ -211,7 +318,7 @@ class Music(commands.Cog):
         if ctx.guild.id not in self.queue or len(self.queue[ctx.guild.id]) == 0:
             await ctx.send("The queue is empty.")
         else:
-            queue_list = "\n".join([f"{i+1}. {song['title']}" for i, song in enumerate(self.queue[ctx.guild.id])])
+            queue_list = "\n".join([f"{i+1}. {song['title']} [{format_duration(song.get('duration'))}]" for i, song in enumerate(self.queue[ctx.guild.id])])
             current_song = self.current_song.get(ctx.guild.id)
             if current_song:
                 queue_list = f"Now playing: {current_song['title']}\n\nQueue:\n{queue_list}"
@@ -280,29 +387,31 @@ class Music(commands.Cog):
         
         async def extract():
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = await asyncio.to_thread(ydl.extract_info, url, download=False)
-                    if 'entries' in info:
-                        # It's a playlist
-                        entries = []
-                        for entry in info['entries']:
-                            try:
-                                video_info = await asyncio.to_thread(ydl.extract_info, entry['url'], download=False)
-                                entries.append({'url': video_info['url'], 'title': video_info['title']})
-                            except Exception as e:
-                                print(f"Error extracting info for {entry.get('title', 'unknown')}: {e}")
-                        return entries
-                    else:
-                        # It's a single video
-                        return [{'url': info['url'], 'title': info['title']}]
+                # yt-dlp runs in the music worker process so large playlists can't stall the bot
+                info = await media_worker.call('extract', url, ydl_opts)
+                if 'entries' in info:
+                    # It's a playlist: the flat extraction only gives IDs, so fetch
+                    # titles and durations in batches instead of one yt-dlp call per entry
+                    flat_entries = info['entries']
+                    try:
+                        return await fetch_video_details([entry['id'] for entry in flat_entries])
+                    except HttpError as e:
+                        logging.warning(f"YouTube Data API lookup failed, using playlist metadata: {e}")
+                        return [{'id': entry['id'], 'title': entry.get('title') or entry['id'],
+                                 'duration': entry.get('duration'), 'webpage_url': f"{YOUTUBE_WATCH_URL}{entry['id']}",
+                                 'url': None} for entry in flat_entries]
+                else:
+                    # It's a single video
+                    return [info]
             except Exception as e:
                 print(f"Error in extract: {e}")
                 return None
 
         try:
-            songs = await asyncio.wait_for(extract(), timeout=300)  # 5 minute timeout for large playlists
+            with track_external():
+                songs = await asyncio.wait_for(extract(), timeout=300)  # 5 minute timeout for large playlists
             if songs:
-                return [song for song in songs if song['url']]  # Filter out any entries without a URL
+                return [song for song in songs if song.get('url') or song.get('webpage_url')]  # Filter out any entries without a URL
             print(f"Failed to extract info for URL: {url}")
             return None
         except asyncio.TimeoutError:
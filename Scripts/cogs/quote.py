@@ -1,37 +1,21 @@
 import discord
 from discord.ext import commands
-import json
 import random
-import os
-import configparser
 
 class QuoteCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        
-        # Read config
-        config = configparser.ConfigParser()
-        config.read(os.path.expanduser('~/Python/.config'))
+        self.quotes = {}
 
-        # Get the cogs directory from config
-        cogs_dir = config['Paths']['cogs_folder']
-        
-        # Set the quotes file path in the json subfolder
-        self.quotes_file = os.path.join(cogs_dir, "json", "quotes.json")
-        
-        self.quotes = self.load_quotes()
+    async def cog_load(self):
+        # Quotes live in the shared store ("quotes" document, keyed by server ID)
+        self.quotes = await self.bot.shared_store.get_all("quotes")
 
-    def load_quotes(self):
-        if os.path.exists(self.quotes_file):
-            with open(self.quotes_file, "r") as f:
-                return json.load(f)
-        return {}
-
-    def save_quotes(self):
-        # Ensure the json subfolder exists
-        os.makedirs(os.path.dirname(self.quotes_file), exist_ok=True)
-        with open(self.quotes_file, "w") as f:
-            json.dump(self.quotes, f, indent=2)
+    async def save_server_quotes(self, server_id):
+        if self.quotes.get(server_id):
+            await self.bot.shared_store.set("quotes", server_id, self.quotes[server_id])
+        else:
+            await self.bot.shared_store.delete("quotes", server_id)
 
     def get_server_quotes(self, server_id):
         return self.quotes.get(str(server_id), {})
@@ -44,7 +28,7 @@ class QuoteCog(commands.Cog):
         if name not in self.quotes[server_id]:
             self.quotes[server_id][name] = []
         self.quotes[server_id][name].append(quote)
-        self.save_quotes()
+        await self.save_server_quotes(server_id)
         await ctx.send(f"Quote added for {name} in this server.")
 
     @commands.command()
@@ -56,7 +40,7 @@ class QuoteCog(commands.Cog):
                 del self.quotes[server_id][name]
             if not self.quotes[server_id]:
                 del self.quotes[server_id]
-            self.save_quotes()
+            await self.save_server_quotes(server_id)
             await ctx.send(f"Quote deleted for {name} in this server.")
         else:
             await ctx.send("Quote not found in this server.")
@@ -1,24 +1,20 @@
 import discord
 from discord.ext import commands, voice_recv
-import speech_recognition as sr
 from datetime import datetime
 import os
 import textwrap
-import configparser
+from utils.config import get_config
+from utils.workers import WorkerError, WorkerProcess
 import wave
 import io
 import logging
-import numpy as np
 import struct
 import asyncio
-from pydub import AudioSegment
-from pydub.effects import normalize
-from pydub.silence import split_on_silence
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+COMBINE_TIMEOUT = 600  # seconds; a long session is several 50MB chunks
+
 class DnDRecorder(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -31,19 +27,21 @@ class DnDRecorder(commands.Cog):
         self.chunk_size = 50 * 1024 * 1024  # 50MB
         self.chunk_count = 0
 
-        # Read config
-        config = configparser.ConfigParser()
-        config.read(os.path.expanduser('~/Python/.config'))
-
-        # Get the cogs directory from config
-        cogs_dir = config['Paths']['cogs_folder']
-
         # Set up the recordings directory
-        default_recordings_dir = os.path.join(cogs_dir, 'recordings')
-        self.output_dir = config.get('Paths', 'recordings_folder', fallback=default_recordings_dir)
+        self.output_dir = get_config().paths.recordings_folder
         os.makedirs(self.output_dir, exist_ok=True)
         logger.debug(f"Output directory set to: {self.output_dir}")
 
+        # Combining, normalizing and transcribing run in a separate process
+        # (see utils/media_tasks.py) so they can't stall the gateway heartbeat
+        self.worker = WorkerProcess('record', 'utils.media_tasks')
+
+    async def cog_load(self):
+        await self.worker.start()
+
+    async def cog_unload(self):
+        await self.worker.stop()
+
     @commands.command()
     async def record(self, ctx):
         if ctx.author.voice is None:
@@ -121,8 +119,9 @@ class DnDRecorder(commands.Cog):
             await self.voice_client.disconnect()
             self.voice_client = None
 
-        self.save_chunk()  # Save any remaining data
-        self.combine_chunks()
+        await asyncio.to_thread(self.save_chunk)  # Save any remaining data
+        if not await self.combine_chunks(ctx):
+            return
 
         await ctx.send(f"Recording saved to {self.current_audio_filename}")
 
@@ -155,42 +154,25 @@ class DnDRecorder(commands.Cog):
             await ctx.send(f"Error: Audio file {self.current_audio_filename} was not created or is empty.")
             logger.error(f"Error: Audio file {self.current_audio_filename} was not created or is empty.")
 
-    def combine_chunks(self):
-        combined = AudioSegment.empty()
-        for i in range(self.chunk_count):
-            chunk_filename = f"{self.current_audio_filename[:-4]}_{i}.wav"
-            if not self.check_wav_file(chunk_filename):
-                logger.error(f"Chunk file {chunk_filename} is not a valid WAV file")
-                continue
-            chunk = AudioSegment.from_wav(chunk_filename)
-            combined += chunk
-            os.remove(chunk_filename)
-
-        combined.export(self.current_audio_filename, format="wav")
-        logger.debug(f"Recording saved to {self.current_audio_filename}")
-        if not self.check_wav_file(self.current_audio_filename):
-            logger.error(f"Combined file {self.current_audio_filename} is not a valid WAV file")
+    async def combine_chunks(self, ctx):
+        """Combine the chunk files into the recording. If the worker fails, the chunks are
+        kept and their paths sent to the channel; returns whether to go on processing."""
+        chunk_filenames = [f"{self.current_audio_filename[:-4]}_{i}.wav" for i in range(self.chunk_count)]
+        try:
+            if not await self.worker.call('combine_chunks', chunk_filenames, self.current_audio_filename,
+                                          timeout=COMBINE_TIMEOUT):
+                logger.error(f"Combined file {self.current_audio_filename} is not a valid WAV file")
+            return True
+        except (WorkerError, asyncio.TimeoutError) as e:
+            logger.error(f"Error combining recording chunks: {e!r}")
+            kept = sum(os.path.exists(filename) for filename in chunk_filenames)
+            await ctx.send(f"Error combining the recording: {str(e) or 'timed out'}. The {kept} recorded "
+                           f"chunks are kept as {self.current_audio_filename[:-4]}_<number>.wav.")
+            return False
 
     async def process_audio(self, input_file, output_file):
-        logger.info(f"Starting audio processing for {input_file}")
         try:
-            # Load the audio file
-            audio = AudioSegment.from_wav(input_file)
-            logger.info(f"Loaded audio file: duration={len(audio)}ms, channels={audio.channels}")
-
-            # Increase volume by 50%
-            audio = audio + 6  # Increasing by 6dB is roughly equivalent to 150% volume
-            logger.info("Increased volume by 50%")
-
-            # Normalize audio
-            audio = normalize(audio)
-            logger.info("Normalized audio")
-
-            # Export the processed audio
-            audio.export(output_file, format="wav")
-            logger.info(f"Exported processed audio to {output_file}")
-
-            return True
+            return await self.worker.call('process_audio', input_file, output_file)
         except Exception as e:
             logger.error(f"Error during audio processing: {str(e)}", exc_info=True)
             return False
@@ -200,51 +182,11 @@ class DnDRecorder(commands.Cog):
             await ctx.send(f"Error: Audio file {self.current_audio_filename} does not exist or is empty.")
             return
 
-        recognizer = sr.Recognizer()
-        recognizer.energy_threshold = 300  # Adjust this value as needed
-
-        full_transcript = ""
+        async def report_chunk(chunk_number):
+            await ctx.send(f"Transcribed chunk {chunk_number}")
 
         try:
-            with wave.open(self.current_audio_filename, 'rb') as wf:
-                frame_rate = wf.getframerate()
-                n_channels = wf.getnchannels()
-                sample_width = wf.getsampwidth()
-                n_frames = wf.getnframes()
-
-                logger.debug(f"Audio file details: rate={frame_rate}, channels={n_channels}, width={sample_width}, frames={n_frames}")
-
-                chunk_duration = 60  # 60 seconds
-                chunk_size = int(chunk_duration * frame_rate * n_channels * sample_width)
-
-                for i in range(0, n_frames, chunk_size):
-                    wf.setpos(i)
-                    chunk = wf.readframes(min(chunk_size, n_frames - i))
-
-                    with io.BytesIO(chunk) as chunk_io:
-                        with wave.open(chunk_io, 'wb') as chunk_wf:
-                            chunk_wf.setnchannels(n_channels)
-                            chunk_wf.setsampwidth(sample_width)
-                            chunk_wf.setframerate(frame_rate)
-                            chunk_wf.writeframes(chunk)
-
-                        chunk_io.seek(0)
-                        with sr.AudioFile(chunk_io) as source:
-                            audio = recognizer.record(source)
-
-                    try:
-                        # Try Google first, then fall back to Sphinx if it fails
-                        try:
-                            transcript = recognizer.recognize_google(audio)
-                        except sr.UnknownValueError:
-                            transcript = recognizer.recognize_sphinx(audio)
-                        full_transcript += transcript + " "
-                        logger.debug(f"Transcribed chunk {i//chunk_size + 1}: {transcript}")
-                        await ctx.send(f"Transcribed chunk {i//chunk_size + 1}")
-                    except sr.UnknownValueError:
-                        logger.warning(f"Could not understand audio in chunk {i//chunk_size + 1}")
-                    except sr.RequestError as e:
-                        logger.error(f"Error in chunk {i//chunk_size + 1}: {str(e)}")
+            full_transcript = await self.worker.call('transcribe', self.current_audio_filename, on_progress=report_chunk)
 
             if not full_transcript:
                 await ctx.send("Transcription failed: No speech could be recognized in the audio.")
@@ -260,21 +202,6 @@ class DnDRecorder(commands.Cog):
             await ctx.send(f"Error during transcription: {str(e)}")
             logger.error(f"Error during transcription: {str(e)}", exc_info=True)
 
-    def check_wav_file(self, filename):
-        try:
-            with wave.open(filename, 'rb') as wf:
-                logger.debug(f"WAV file details for {filename}:")
-                logger.debug(f"Number of channels: {wf.getnchannels()}")
-                logger.debug(f"Sample width: {wf.getsampwidth()}")
-                logger.debug(f"Frame rate: {wf.getframerate()}")
-                logger.debug(f"Number of frames: {wf.getnframes()}")
-                logger.debug(f"Compression type: {wf.getcomptype()}")
-                logger.debug(f"Compression name: {wf.getcompname()}")
-            return True
-        except wave.Error as e:
-            logger.error(f"Error reading WAV file {filename}: {str(e)}")
-            return False
-
     async def send_long_message(self, ctx, message):
         chunks = textwrap.wrap(message, 1900)
         for chunk in chunks:
@@ -1,33 +1,21 @@
 import discord
 from discord.ext import commands, tasks
 import re
-import json
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
-import os
-import configparser
+from utils.cluster import owns_guild
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s:%(levelname)s:%(message)s')
+logger = logging.getLogger(__name__)
 
 class Reminder(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.reminders = {}
-        
-        # Read config
-        config = configparser.ConfigParser()
-        config.read(os.path.expanduser('~/Python/.config'))
 
-        # Get the cogs directory from config
-        cogs_dir = config['Paths']['cogs_folder']
-        
-        # Set the reminder file path in the json subfolder
-        self.reminder_file = os.path.join(cogs_dir, "json", "reminders.json")
-        
-        self.load_reminders()
+    async def cog_load(self):
+        await self.load_reminders()
         self.check_reminders.start()
 
     def cog_unload(self):
@@ -53,15 +41,16 @@ class Reminder(commands.Cog):
             "channel_id": ctx.channel.id,
             "remind_time": remind_time.isoformat(),
             "message": message,
-            "original_channel": ctx.channel.name
+            "original_channel": ctx.channel.name,
+            "guild_id": ctx.guild.id if ctx.guild else None
         }
 
         self.reminders[reminder_id] = reminder
-        self.save_reminders()
+        await self.bot.shared_store.set("reminders", reminder_id, reminder)
 
         await ctx.send(f"I'll remind you at {remind_time.strftime('%Y-%m-%d %H:%M:%S')} UTC with the message: {message}")
 
-        logging.info(f"Set reminder: {reminder}")
+        logger.info(f"Set reminder: {reminder}")
 
     def parse_time(self, time_str: str) -> Optional[int]:
         pattern = r'(\d+)([dhms])'
@@ -84,9 +73,14 @@ class Reminder(commands.Cog):
 
         return total_seconds
 
+    async def user_reminders(self, user_id: int) -> list:
+        # From the shared store rather than self.reminders, which only has this cluster's guilds
+        reminders = await self.bot.shared_store.get_all("reminders")
+        return [reminder for reminder in reminders.values() if reminder['user_id'] == user_id]
+
     @commands.command()
     async def showreminders(self, ctx):
-        user_reminders = [r for r in self.reminders.values() if r['user_id'] == ctx.author.id]
+        user_reminders = await self.user_reminders(ctx.author.id)
         
         if not user_reminders:
             await ctx.send("You don't have any active reminders.")
@@ -126,20 +120,31 @@ class Reminder(commands.Cog):
 
     @tasks.loop(seconds=5)
     async def check_reminders(self):
-        current_time = datetime.utcnow()
-        reminders_to_remove = []
-
-        for reminder_id, reminder in self.reminders.items():
-            remind_time = datetime.fromisoformat(reminder["remind_time"])
-            if remind_time <= current_time:
-                await self.send_reminder(reminder)
-                reminders_to_remove.append(reminder_id)
+        # Hold reminders back while the connection is flapping; they are sent once it settles
+        monitor = getattr(self.bot, 'connection_monitor', None)
+        if monitor and not monitor.is_stable():
+            return
 
-        for reminder_id in reminders_to_remove:
-            del self.reminders[reminder_id]
+        current_time = datetime.utcnow()
+        due = [reminder_id for reminder_id, reminder in self.reminders.items()
+               if datetime.fromisoformat(reminder["remind_time"]) <= current_time]
+        if not due:
+            return
 
-        if reminders_to_remove:
-            self.save_reminders()
+        # A reminder may have been removed through another cluster since it was loaded
+        stored = await self.bot.shared_store.get_all("reminders")
+        for reminder_id in due:
+            # .removereminder may have taken it out while this loop was waiting
+            reminder = self.reminders.pop(reminder_id, None)
+            if reminder is None:
+                continue
+            if reminder_id in stored:
+                try:
+                    await self.send_reminder(reminder)
+                except Exception as e:
+                    # One failed delivery must not stop the loop for everyone else's reminders
+                    logger.error(f"Failed to send reminder {reminder_id}: {e}", exc_info=True)
+            await self.bot.shared_store.delete("reminders", reminder_id)
 
     async def send_reminder(self, reminder):
         user = self.bot.get_user(reminder["user_id"])
@@ -149,55 +154,48 @@ class Reminder(commands.Cog):
         if user:
             try:
                 await user.send(f"Reminder from {reminder['original_channel']}: {reminder['message']}")
-                logging.info(f"Sent reminder {reminder['id']} to user {user.id} via DM")
+                logger.info(f"Sent reminder {reminder['id']} to user {user.id} via DM")
             except discord.errors.Forbidden:
-                logging.warning(f"Couldn't send DM to user {user.id}, attempting to send in original channel")
+                logger.warning(f"Couldn't send DM to user {user.id}, attempting to send in original channel")
                 channel = self.bot.get_channel(reminder["channel_id"])
                 if channel:
                     await channel.send(f"{user.mention}, I couldn't send you a DM. Here's your reminder: {reminder['message']}")
-                    logging.info(f"Sent reminder {reminder['id']} to channel {channel.id}")
+                    logger.info(f"Sent reminder {reminder['id']} to channel {channel.id}")
                 else:
-                    logging.error(f"Couldn't find channel {reminder['channel_id']} to send reminder {reminder['id']}")
+                    logger.error(f"Couldn't find channel {reminder['channel_id']} to send reminder {reminder['id']}")
         else:
-            logging.error(f"Couldn't find user {reminder['user_id']} for reminder {reminder['id']}")
+            logger.error(f"Couldn't find user {reminder['user_id']} for reminder {reminder['id']}")
 
     @check_reminders.before_loop
     async def before_check_reminders(self):
         await self.bot.wait_until_ready()
 
-    def save_reminders(self):
-        # Ensure the json subfolder exists
-        os.makedirs(os.path.dirname(self.reminder_file), exist_ok=True)
-        with open(self.reminder_file, 'w') as f:
-            json.dump(self.reminders, f, indent=4)
-        logging.info(f"Saved {len(self.reminders)} reminders to file: {self.reminder_file}")
-
-    def load_reminders(self):
-        try:
-            with open(self.reminder_file, 'r') as f:
-                self.reminders = json.load(f)
-            logging.info(f"Loaded {len(self.reminders)} reminders from file: {self.reminder_file}")
-        except FileNotFoundError:
-            self.reminders = {}
-            logging.info(f"No reminders file found at {self.reminder_file}, starting with empty reminders")
+    async def load_reminders(self):
+        # Reminders are shared between clusters; each one only sends those of the guilds it serves.
+        # Reminders saved before guild_id was recorded belong to the cluster serving DMs.
+        reminders = await self.bot.shared_store.get_all("reminders")
+        self.reminders = {reminder_id: reminder for reminder_id, reminder in reminders.items()
+                          if owns_guild(self.bot, reminder.get("guild_id"))}
+        logger.info(f"Loaded {len(self.reminders)} of {len(reminders)} reminders")
 
     @commands.command()
     async def removereminder(self, ctx, reminder_id: str):
-        if reminder_id not in self.reminders:
+        reminders = await self.bot.shared_store.get_all("reminders")
+        if reminder_id not in reminders:
             await ctx.send(f"No reminder found with ID {reminder_id}.")
             return
 
-        reminder = self.reminders[reminder_id]
+        reminder = reminders[reminder_id]
         
         if ctx.author.id != reminder['user_id']:
             await ctx.send("You are not authorized to remove this reminder.")
             return
 
-        del self.reminders[reminder_id]
-        self.save_reminders()
+        self.reminders.pop(reminder_id, None)
+        await self.bot.shared_store.delete("reminders", reminder_id)
 
         await ctx.send(f"Reminder with ID {reminder_id} has been removed.")
-        logging.info(f"Removed reminder {reminder_id} for user {ctx.author.id}")
+        logger.info(f"Removed reminder {reminder_id} for user {ctx.author.id}")
 
 async def setup(bot):
     await bot.add_cog(Reminder(bot))
\ No newline at end of file
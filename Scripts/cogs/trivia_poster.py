@@ -8,8 +8,6 @@ from collections import defaultdict
 from datetime import timedelta, datetime
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
 class TriviaCog(commands.Cog):
@@ -51,18 +49,17 @@ class TriviaCog(commands.Cog):
         if category:
             url += f"&category={category}"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if 'results' in data and len(data['results']) > 0:
-                            return data['results'][0]
-                        else:
-                            logger.error(f"Invalid API response: {data}")
-                            return None
+            async with self.bot.http_client.session.get(url) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if 'results' in data and len(data['results']) > 0:
+                        return data['results'][0]
                     else:
-                        logger.error(f"API request failed with status {response.status}")
+                        logger.error(f"Invalid API response: {data}")
                         return None
+                else:
+                    logger.error(f"API request failed with status {response.status}")
+                    return None
         except aiohttp.ClientError as e:
             logger.error(f"Error fetching question: {str(e)}")
             return None
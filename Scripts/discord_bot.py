@@ -1,23 +1,168 @@
 import discord
 from discord.ext import commands
 import os
+import argparse
 import asyncio
 import logging
-import configparser
+import random
+import shutil
+import signal
+import tempfile
+import time
 import aiohttp
+from utils.cluster import (ClusterCoordinator, ClusterLauncher, CoordinatorClient, JsonDocumentStore,
+                           fetch_recommended_shards)
+from utils.config import get_config
+from utils.extensions import run_extension_op
+from utils.logging_setup import apply_levels, setup_logging
+from utils.memory import rss_bytes, start_tracing
+from utils.http_client import HttpClient
+from utils.metrics import Metrics
+from utils.stall_detector import StallDetector
 
-# Read config
-config = configparser.ConfigParser()
-config.read(os.path.expanduser('~/Python/.config'))
+# Cluster processes are started by the launcher with their shard range (see utils/cluster.py)
+parser = argparse.ArgumentParser(description="Discord bot")
+parser.add_argument('--cluster-id', type=int, help="Run as this cluster of a sharded launch")
+parser.add_argument('--shard-ids', type=lambda value: [int(shard) for shard in value.split(',')])
+parser.add_argument('--shard-count', type=int)
+parser.add_argument('--coordinator', help="Socket of the launcher's shared state coordinator")
+args, _ = parser.parse_known_args()
+IS_CLUSTER = args.cluster_id is not None
+
+def cluster_path(path: str) -> str:
+    """Give each cluster process its own copy of a per-process output file."""
+    if not IS_CLUSTER:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.cluster{args.cluster_id}{ext}"
+
+# Intents the low_memory profile turns off, with the events that would need them
+LOW_MEMORY_DROPPED_INTENTS = {
+    'emojis_and_stickers': ('on_guild_emojis_update', 'on_guild_stickers_update'),
+    'typing': ('on_typing', 'on_raw_typing'),
+    'invites': ('on_invite_create', 'on_invite_delete'),
+    'webhooks': ('on_webhooks_update',),
+    'integrations': ('on_integration_create', 'on_integration_update', 'on_guild_integrations_update',
+                     'on_raw_integration_delete'),
+    'guild_scheduled_events': ('on_scheduled_event_create', 'on_scheduled_event_update',
+                               'on_scheduled_event_delete', 'on_scheduled_event_user_add',
+                               'on_scheduled_event_user_remove'),
+}
+# Events that only fire for messages still in the message cache
+CACHED_MESSAGE_EVENTS = ('on_message_edit', 'on_message_delete', 'on_bulk_message_delete',
+                         'on_reaction_add', 'on_reaction_remove', 'on_reaction_clear')
+
+def low_memory_options(intents: discord.Intents) -> dict:
+    """Trim the intents and client caches down to what the cogs use.
+
+    The cogs only read commands and plain messages (wait_for('message') does not
+    need the message cache) and look at voice channel members (music, record),
+    so the other gateway events and caches can go. `check_cache_profile` warns
+    if a loaded cog listens for one of the events this turns off.
+    """
+    for intent in LOW_MEMORY_DROPPED_INTENTS:
+        setattr(intents, intent, False)
+    max_messages = config.getint('Client', 'max_messages', fallback=0)
+    return dict(
+        # The message cache only backs edit/delete/reaction events for old messages
+        max_messages=max_messages or None,
+        chunk_guilds_at_startup=False,
+        # Keep members only while they are in a voice channel
+        member_cache_flags=discord.MemberCacheFlags(voice=intents.voice_states, joined=False),
+    )
+
+# Read config (parsed once and shared with the cogs through bot.config)
+config = get_config()
 TOKEN = config['Discord']['TOKEN']
+CACHE_PROFILE = config.get('Client', 'cache_profile', fallback='default')
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='.', intents=intents, help_command=None)
-COGS_DIR = config['Paths']['cogs_folder']
+cache_options = low_memory_options(intents) if CACHE_PROFILE == 'low_memory' else {}
+metrics = Metrics(cluster_path(config.get('Metrics', 'prometheus_file',
+                                          fallback=os.path.join(config['Paths']['scripts_folder'], 'bot_metrics.prom'))),
+                  export_interval=config.getfloat('Metrics', 'export_interval', fallback=15.0))
+bot_options = dict(command_prefix='.', intents=intents, help_command=None,
+                   http_trace=metrics.discord_trace_config(), **cache_options)
+if IS_CLUSTER:
+    bot = commands.AutoShardedBot(shard_ids=args.shard_ids, shard_count=args.shard_count, **bot_options)
+    bot.shared_store = CoordinatorClient(args.coordinator)
+else:
+    bot = commands.Bot(**bot_options)
+    bot.shared_store = JsonDocumentStore(config.paths.json_folder)
+bot.config = config
+bot.cache_profile = CACHE_PROFILE
+bot.cache_options = cache_options
+bot.log_file = cluster_path(config.paths.bot_log_file)  # this process's log, read by the log viewer
+bot.extension_timings = {}
+bot.memory_snapshots = {'startup': rss_bytes()}
+bot.metrics = metrics
+metrics.install(bot)
+bot.http_client = HttpClient.from_config(config)
+bot.stall_detector = StallDetector(config.getfloat('Diagnostics', 'stall_threshold_ms', fallback=250.0))
+COGS_DIR = config.paths.cogs_folder
+
+class ConnectionMonitor:
+    """Tracks gateway disconnects so that outages can be reported and cog
+    background tasks can hold off while the connection is flapping."""
+
+    def __init__(self, stable_after: float = 30.0):
+        self.stable_after = stable_after  # seconds connected before the link counts as stable
+        self.connected_since = None
+        self.disconnected_since = None
+        self.disconnect_count = 0
+        self.resume_count = 0
+        self.restart_count = 0
+        self.total_downtime = 0.0
+        self.longest_downtime = 0.0
+
+    def mark_connected(self, resumed: bool = False):
+        now = time.monotonic()
+        if resumed:
+            self.resume_count += 1
+        if self.disconnected_since is not None:
+            downtime = now - self.disconnected_since
+            self.total_downtime += downtime
+            self.longest_downtime = max(self.longest_downtime, downtime)
+            logging.info(f"Connection restored after {downtime:.1f}s ({'resumed' if resumed else 'new session'})")
+            self.disconnected_since = None
+        if self.connected_since is None:
+            self.connected_since = now
 
-# Configure logging
-logging.basicConfig(filename=config['Paths']['bot_log_file'], level=logging.DEBUG,
-                    format='%(asctime)s:%(levelname)s:%(message)s')
+    def mark_disconnected(self):
+        if self.disconnected_since is not None:
+            return
+        self.disconnect_count += 1
+        self.connected_since = None
+        self.disconnected_since = time.monotonic()
+        logging.warning(f"Disconnected from Discord (disconnect #{self.disconnect_count})")
+
+    def is_stable(self) -> bool:
+        """True once the bot has stayed connected for `stable_after` seconds."""
+        return self.connected_since is not None and time.monotonic() - self.connected_since >= self.stable_after
+
+class ReconnectPolicy:
+    """Capped exponential backoff with jitter for restarting the client."""
+
+    def __init__(self, base: float = 2.0, cap: float = 300.0, reset_after: float = 600.0):
+        self.base = base
+        self.cap = cap
+        self.reset_after = reset_after  # a session this long resets the backoff
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.cap, self.base * (2 ** self.attempts))
+        self.attempts += 1
+        # Jitter the upper half of the window so restarts from several flaps don't line up
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+bot.connection_monitor = ConnectionMonitor()
+
+# Configure logging (file writes happen on a background thread)
+log_listener = setup_logging(config, bot.log_file)
+config.subscribe('Logging', apply_levels)
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -30,34 +175,136 @@ async def on_command_error(ctx, error):
     
 @bot.event
 async def on_ready():
+    bot.connection_monitor.mark_connected()
+    bot.memory_snapshots.setdefault('ready', rss_bytes())
     logging.info(f'We have logged in as {bot.user}')
 
+@bot.event
+async def on_resumed():
+    bot.connection_monitor.mark_connected(resumed=True)
+
+@bot.event
+async def on_disconnect():
+    bot.connection_monitor.mark_disconnected()
+
+@bot.command(name="connstats")
+@commands.is_owner()
+async def connection_stats(ctx):
+    """Show gateway disconnect and reconnect statistics."""
+    monitor = bot.connection_monitor
+    uptime = time.monotonic() - monitor.connected_since if monitor.connected_since else 0.0
+    cluster = f"Cluster {args.cluster_id}, shards {bot.shard_ids} of {bot.shard_count}\n" if IS_CLUSTER else ""
+    await ctx.send(f"{cluster}"
+                   f"Connected for: {uptime:.0f}s\n"
+                   f"Disconnects: {monitor.disconnect_count} "
+                   f"(resumed: {monitor.resume_count}, client restarts: {monitor.restart_count})\n"
+                   f"Total downtime: {monitor.total_downtime:.1f}s "
+                   f"(longest: {monitor.longest_downtime:.1f}s)\n"
+                   f"Gateway latency: {bot.latency * 1000:.0f}ms")
+
 async def load_extensions():
     if os.path.exists(COGS_DIR) and os.path.isdir(COGS_DIR):
         for filename in os.listdir(COGS_DIR):
             if filename.endswith(".py"):
                 try:
-                    await bot.load_extension(f"cogs.{filename[:-3]}")
-                    logging.info(f"Loaded extension: {filename[:-3]}")
+                    elapsed = await run_extension_op(bot, 'load', f"cogs.{filename[:-3]}")
+                    logging.info(f"Loaded extension: {filename[:-3]} ({elapsed:.2f}s)")
                 except Exception as e:
                     logging.error(f"Failed to load extension {filename}: {e}")
     else:
         logging.error(f"Directory '{COGS_DIR}' does not exist")
 
-async def main():
+def check_cache_profile():
+    """Warn about loaded listeners for events the cache profile keeps from arriving."""
+    if CACHE_PROFILE != 'low_memory':
+        return
+    listeners = set(bot.extra_events)
+    for intent, events in LOW_MEMORY_DROPPED_INTENTS.items():
+        for event in listeners.intersection(events):
+            logging.warning(f"A loaded extension listens for {event}, but the low_memory cache profile "
+                            f"turns off the {intent} intent it needs")
+    if not cache_options.get('max_messages'):
+        for event in listeners.intersection(CACHED_MESSAGE_EVENTS):
+            logging.warning(f"A loaded extension listens for {event}, which only fires for cached messages, "
+                            f"but the low_memory cache profile has the message cache disabled")
+
+async def setup_hook():
+    # Runs on every login, so extensions come back after a full client restart
+    # (closing a commands.Bot unloads all of its extensions)
     await load_extensions()
+    check_cache_profile()
+
+bot.setup_hook = setup_hook
+
+async def run_launcher():
+    """Run the bot as several cluster processes, each handling a range of shards."""
+    shard_count = config.get('Cluster', 'shard_count', fallback='auto')
+    shard_count = await fetch_recommended_shards(TOKEN) if shard_count == 'auto' else int(shard_count)
+
+    socket_dir = tempfile.mkdtemp(prefix='bot-cluster-')  # created with mode 0700
+    coordinator = ClusterCoordinator(JsonDocumentStore(config.paths.json_folder),
+                                     os.path.join(socket_dir, 'coordinator.sock'))
+    await coordinator.start()
+    launcher = ClusterLauncher(os.path.abspath(__file__), shard_count,
+                               config.getint('Cluster', 'clusters', fallback=2), coordinator.socket_path)
+
+    # Take the clusters down with us when the service manager stops the launcher
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await launcher.run()
+    except asyncio.CancelledError:
+        logging.info("Launcher stopping, terminating clusters")
+    finally:
+        await launcher.stop()
+        await coordinator.stop()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+async def main():
+    if not IS_CLUSTER and config.getboolean('Cluster', 'enabled', fallback=False):
+        await run_launcher()
+        return
+
+    policy = ReconnectPolicy()
+    start_tracing(config.getint('Diagnostics', 'tracemalloc_frames', fallback=0))
+    metrics.start()
+    bot.stall_detector.start()
+    config.start_watching()
     
-    while True:
-        try:
-            await bot.start(TOKEN)
-        except discord.errors.ConnectionClosed:
-            logging.warning("Connection closed. Retrying in 5 seconds...")
-        except aiohttp.ClientConnectionError:
-            logging.warning("Connection error. Retrying in 5 seconds...")
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-        
-        await asyncio.sleep(5)  # Wait for 5 seconds before retrying
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                # reconnect=True lets discord.py RESUME the gateway session on its own;
+                # we only get here when the client gives up or cannot log in at all
+                await bot.start(TOKEN, reconnect=True)
+            except discord.errors.LoginFailure as e:
+                logging.critical(f"Login failed, not retrying: {e}")
+                raise
+            except discord.errors.ConnectionClosed as e:
+                logging.warning(f"Connection closed (code {e.code}).")
+            except aiohttp.ClientConnectionError as e:
+                logging.warning(f"Connection error: {e}")
+            except Exception as e:
+                logging.error(f"An error occurred: {e}")
+
+            bot.connection_monitor.mark_disconnected()
+            bot.connection_monitor.restart_count += 1
+            if not bot.is_closed():
+                await bot.close()
+            bot.clear()
+
+            if time.monotonic() - started >= policy.reset_after:
+                policy.reset()
+            delay = policy.next_delay()
+            logging.warning(f"Restarting client in {delay:.1f} seconds (attempt {policy.attempts})...")
+            await asyncio.sleep(delay)
+    finally:
+        config.stop_watching()
+        await bot.http_client.close()
+        await bot.shared_store.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
\ No newline at end of file
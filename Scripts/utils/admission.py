@@ -0,0 +1,185 @@
+"""
+Admission control for expensive external calls.
+
+A request needs a token from its user's bucket, a token from the global
+bucket and a free concurrency slot. Requests that can't start right away
+wait in a per-user queue. Users are served round-robin, so one user's
+burst can't hold everyone else back, and waiting requests are told their
+position as it changes.
+"""
+import asyncio
+import contextlib
+import inspect
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+PositionCallback = Callable[[int], Union[None, Awaitable[None]]]
+
+class QueueFull(Exception):
+    """Raised when a user already has the maximum number of requests waiting."""
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+
+class _Ticket:
+    __slots__ = ('user', 'future', 'on_position', 'position')
+
+    def __init__(self, user: str, future: asyncio.Future, on_position: Optional[PositionCallback]):
+        self.user = user
+        self.future = future
+        self.on_position = on_position
+        self.position = 0
+
+class AdmissionController:
+    def __init__(self, user_rate: float, user_burst: float, global_rate: float, global_burst: float,
+                 max_concurrent: int, max_queued_per_user: int = 3):
+        self.user_rate = user_rate
+        # A bucket that can't hold a whole token never admits anything, so bursts are at least 1
+        self.user_burst = max(1.0, user_burst)
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_burst))
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued_per_user = max_queued_per_user
+        self.active = 0
+        self.admitted = 0
+        self.queued = 0
+        self._user_buckets: Dict[str, TokenBucket] = {}
+        self._queues: 'OrderedDict[str, Deque[_Ticket]]' = OrderedDict()  # users in round-robin order
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def configure(self, user_rate: float, user_burst: float, global_rate: float, global_burst: float,
+                  max_concurrent: int, max_queued_per_user: int):
+        self.user_rate = user_rate
+        self.user_burst = max(1.0, user_burst)
+        for bucket in self._user_buckets.values():
+            bucket.rate, bucket.capacity = user_rate, self.user_burst
+        self.global_bucket.rate, self.global_bucket.capacity = global_rate, max(1.0, global_burst)
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued_per_user = max_queued_per_user
+        self._dispatch()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def has_room(self, user: str) -> bool:
+        """Whether `user` may queue another request."""
+        return len(self._queues.get(user, ())) < self.max_queued_per_user
+
+    def _user_bucket(self, user: str) -> TokenBucket:
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            bucket = self._user_buckets[user] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user: str, on_position: Optional[PositionCallback] = None):
+        """Wait until `user` may start a request and hold a concurrency slot while it runs.
+
+        `on_position` (sync or async) is called with the request's place in the queue
+        whenever it has to wait and that place changes.
+        """
+        if not self.has_room(user):
+            raise QueueFull(f"{user} already has {self.max_queued_per_user} requests waiting")
+
+        ticket = _Ticket(user, asyncio.get_running_loop().create_future(), on_position)
+        self._queues.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+        if not ticket.future.done():
+            self.queued += 1
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self._release()  # admitted just as the caller gave up
+            else:
+                self._remove(ticket)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user]
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        now = time.monotonic()
+        while self._queues and self.active < self.max_concurrent and self.global_bucket.available(now):
+            # The first user in round-robin order whose own bucket has a token goes next
+            user = next((user for user in self._queues if self._user_bucket(user).available(now)), None)
+            if user is None:
+                break
+            queue = self._queues[user]
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._user_bucket(user).take(now)
+            self.global_bucket.take(now)
+            self.active += 1
+            self.admitted += 1
+            ticket.future.set_result(None)
+
+        self._notify_positions()
+
+        # Come back when a bucket refills; released slots and new requests dispatch on their own
+        if self._queues and self.active < self.max_concurrent:
+            delay = max(self.global_bucket.wait_time(now),
+                        min(self._user_bucket(user).wait_time(now) for user in self._queues))
+            if delay != float('inf'):
+                self._wakeup = asyncio.get_running_loop().call_later(max(delay, 0.01), self._dispatch)
+
+    def _service_order(self) -> List[_Ticket]:
+        """Waiting tickets in the order round-robin would admit them (ignoring refill times)."""
+        order = []
+        queues = list(self._queues.values())
+        for round_index in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[round_index] for queue in queues if len(queue) > round_index)
+        return order
+
+    def _notify_positions(self):
+        for position, ticket in enumerate(self._service_order(), start=1):
+            if ticket.position != position:
+                ticket.position = position
+                if ticket.on_position is not None:
+                    result = ticket.on_position(position)
+                    if inspect.isawaitable(result):
+                        asyncio.ensure_future(result)
@@ -0,0 +1,100 @@
+"""
+In-memory caching helpers shared by the cogs.
+
+TTLCache is an LRU cache whose entries also expire. Expiry times are wall
+clock timestamps so a dumped cache can be loaded again after a restart.
+SingleFlight lets concurrent callers asking for the same key share one
+in-flight call instead of each making their own.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether `key` has an unexpired entry. Doesn't count as a lookup or refresh its LRU position."""
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.time()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def dump(self) -> List[list]:
+        """Unexpired entries as `[key, expires_at, value]`, least recently used first."""
+        now = time.time()
+        return [[key, expires, value] for key, (expires, value) in self._data.items() if expires > now]
+
+    def load(self, entries: List[list]):
+        now = time.time()
+        for key, expires, value in entries:
+            if expires > now:
+                self._data[key] = (expires, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+class SingleFlight:
+    def __init__(self):
+        self.shared_calls = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await `factory()` unless a call for `key` is already running, in which case
+        wait for that one. Returns the result and whether it came from another caller."""
+        future = self._calls.get(key)
+        shared = future is not None
+        if shared:
+            self.shared_calls += 1
+        else:
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # A caller giving up must not cancel the call for everyone else
+        return await asyncio.shield(future), shared
+
+    async def cancel_all(self):
+        """Cancel the running calls and wait for them to end. Cancelling a caller doesn't reach
+        the shielded call itself, so do this before closing anything the calls use."""
+        calls = list(self._calls.values())
+        for future in calls:
+            future.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
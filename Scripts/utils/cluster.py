@@ -0,0 +1,249 @@
+"""
+Optional cluster mode and the shared state used by the cogs.
+
+With [Cluster] enabled = true, discord_bot.py becomes a launcher: it works
+out the shard count, splits the shards into contiguous ranges and runs one
+AutoShardedBot process per range (`discord_bot.py --cluster-id N ...`),
+each with its own event loop. The launcher also runs a small coordinator
+that owns the shared JSON documents (quotes, reminders), so clusters never
+write the same file.
+
+Cogs always go through `bot.shared_store`: a JsonDocumentStore in single
+process mode, or a CoordinatorClient talking to the launcher in cluster
+mode. Both expose the same async get_all/set/delete API.
+"""
+import asyncio
+import copy
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from utils.workers import read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_BOT_URL = 'https://discord.com/api/v10/gateway/bot'
+
+class CoordinatorError(Exception):
+    """Raised when a request to the cluster coordinator fails."""
+
+def shard_ranges(shard_count: int, clusters: int) -> List[List[int]]:
+    """Split shard IDs into at most `clusters` contiguous ranges."""
+    per_cluster = math.ceil(shard_count / clusters)
+    return [list(range(start, min(start + per_cluster, shard_count)))
+            for start in range(0, shard_count, per_cluster)]
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+def owns_guild(bot, guild_id: Optional[int]) -> bool:
+    """Whether this process serves `guild_id` (DMs belong to shard 0)."""
+    shard_ids = getattr(bot, 'shard_ids', None)
+    if not shard_ids or not bot.shard_count:
+        return True
+    shard_id = 0 if guild_id is None else shard_for_guild(guild_id, bot.shard_count)
+    return shard_id in shard_ids
+
+async def fetch_recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_BOT_URL, headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            return (await response.json())['shards']
+
+class JsonDocumentStore:
+    """Dictionaries persisted as `<folder>/<name>.json`, written off the event loop."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, f"{name}.json")
+
+    async def _document(self, name: str) -> Dict[str, Any]:
+        if name not in self._documents:
+            self._documents[name] = await asyncio.to_thread(self._load, self._path(name))
+        return self._documents[name]
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, Any]:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def _write(path: str, data: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def _save(self, name: str):
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            data = json.dumps(self._documents[name], indent=2)
+            await asyncio.to_thread(self._write, self._path(name), data)
+
+    async def get_all(self, name: str) -> Dict[str, Any]:
+        return copy.deepcopy(await self._document(name))
+
+    async def set(self, name: str, key: str, value: Any):
+        (await self._document(name))[key] = copy.deepcopy(value)
+        await self._save(name)
+
+    async def delete(self, name: str, key: str):
+        if (await self._document(name)).pop(key, None) is not None:
+            await self._save(name)
+
+    async def close(self):
+        pass
+
+class CoordinatorClient:
+    """Same API as JsonDocumentStore, served by the launcher's coordinator."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._reader = None
+        self._writer = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._connect_lock = asyncio.Lock()
+        self._read_task = None
+
+    async def _ensure_connected(self):
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                self._read_task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = await read_frame(self._reader)
+                future = self._pending.pop(message['id'], None)
+                if future is None or future.done():
+                    continue
+                if message['ok']:
+                    future.set_result(message['result'])
+                else:
+                    future.set_exception(CoordinatorError(message['error']))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CoordinatorError("Lost connection to the cluster coordinator"))
+            self._pending.clear()
+            self._writer = None
+
+    async def _request(self, op: str, *args):
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        write_frame(self._writer, {'id': request_id, 'op': op, 'args': args})
+        await self._writer.drain()
+        return await future
+
+    async def get_all(self, name: str) -> Dict[str, Any]:
+        return await self._request('get_all', name)
+
+    async def set(self, name: str, key: str, value: Any):
+        await self._request('set', name, key, value)
+
+    async def delete(self, name: str, key: str):
+        await self._request('delete', name, key)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._read_task is not None:
+            self._read_task.cancel()
+
+class ClusterCoordinator:
+    """Serves a JsonDocumentStore to the cluster processes over a Unix socket."""
+
+    OPS = ('get_all', 'set', 'delete')
+
+    def __init__(self, store: JsonDocumentStore, socket_path: str):
+        self.store = store
+        self.socket_path = socket_path
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                message = await read_frame(reader)
+                try:
+                    if message['op'] not in self.OPS:
+                        raise ValueError(f"Unknown operation {message['op']}")
+                    result = await getattr(self.store, message['op'])(*message['args'])
+                    write_frame(writer, {'id': message['id'], 'ok': True, 'result': result})
+                except Exception as e:
+                    write_frame(writer, {'id': message['id'], 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+class ClusterLauncher:
+    """Runs one bot process per shard range and restarts any that exit."""
+
+    def __init__(self, script: str, shard_count: int, clusters: int, coordinator_socket: str):
+        self.script = script
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.coordinator_socket = coordinator_socket
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+
+    async def run(self):
+        logger.info(f"Starting {len(self.ranges)} clusters for {self.shard_count} shards: {self.ranges}")
+        await asyncio.gather(*(self._supervise(cluster_id, shard_ids)
+                               for cluster_id, shard_ids in enumerate(self.ranges)))
+
+    async def stop(self):
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(process.wait() for process in self.processes.values()), return_exceptions=True)
+
+    async def _supervise(self, cluster_id: int, shard_ids: List[int]):
+        delay = 5.0
+        while True:
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, self.script,
+                '--cluster-id', str(cluster_id),
+                '--shard-ids', ','.join(map(str, shard_ids)),
+                '--shard-count', str(self.shard_count),
+                '--coordinator', self.coordinator_socket,
+            )
+            self.processes[cluster_id] = process
+            logger.info(f"Started cluster {cluster_id} (shards {shard_ids}, pid {process.pid})")
+            returncode = await process.wait()
+
+            # Stagger restarts so crashing clusters don't all identify at once
+            delay = 5.0 if time.monotonic() - started > 600 else min(delay * 2, 300.0)
+            logger.warning(f"Cluster {cluster_id} exited with code {returncode}, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
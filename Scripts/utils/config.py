@@ -0,0 +1,221 @@
+"""
+Shared bot configuration.
+
+`~/Python/.config` is parsed once per process and the same `BotConfig` is
+handed to every cog (`get_config()` / `bot.config`). When watching is
+enabled the file is followed with watchdog (inotify on the Pi); after an
+edit the file is re-parsed and subscribers of the sections that changed are
+called on the event loop, so settings can be changed without a restart.
+"""
+import asyncio
+import configparser
+import inspect
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.expanduser('~/Python/.config')
+
+DEFAULT_SYSTEM_PROMPT = ("You are Claude, answering questions from members of a Discord server. "
+                         "Several people may take part in the conversation. Keep answers concise.")
+
+@dataclass(frozen=True)
+class PathsConfig:
+    main_folder: str
+    scripts_folder: str
+    cogs_folder: str
+    log_file: str
+    bot_log_file: str
+    config_file: str
+    pictures_folder: str
+    recordings_folder: str
+    json_folder: str
+
+@dataclass(frozen=True)
+class AIConfig:
+    api_key: str
+    allowed_users: List[str]
+    input_cost_per_1m_tokens: float
+    output_cost_per_1m_tokens: float
+    rate_limit: float
+    cache_ttl: float
+    cache_size: int
+    usage_db: str
+    user_burst: float
+    global_requests_per_minute: float
+    global_burst: float
+    max_concurrent: int
+    max_queued_per_user: int
+    system_prompt: str
+    context_tokens: int
+    context_idle_minutes: float
+    summarize_context: bool
+    tokenizer_file: Optional[str]
+    fast_model: str
+    fast_model_max_prompt_tokens: int
+    fast_input_cost_per_1m_tokens: float
+    fast_output_cost_per_1m_tokens: float
+    daily_user_budget: float
+    monthly_budget: float
+    summarize_max_messages: int
+    summarize_chunk_tokens: int
+    summarize_concurrency: int
+
+class _ConfigFileHandler(FileSystemEventHandler):
+    def __init__(self, config: 'BotConfig'):
+        self.config = config
+
+    def on_any_event(self, event):
+        paths = {getattr(event, 'src_path', None), getattr(event, 'dest_path', None)}
+        if self.config.path in paths and event.event_type in ('modified', 'created', 'moved'):
+            self.config._schedule_reload()
+
+class BotConfig(configparser.ConfigParser):
+    """The parsed config file, with typed views of the common sections and
+    change notifications per section."""
+
+    def __init__(self, path: str = CONFIG_PATH, reload_delay: float = 0.5):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.reload_delay = reload_delay  # editors write in several steps; wait for them to finish
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._observer: Optional[Observer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_reload: Optional[asyncio.TimerHandle] = None
+        self.read(self.path)
+
+    # Typed views
+
+    @property
+    def paths(self) -> PathsConfig:
+        paths = self['Paths']
+        return PathsConfig(
+            main_folder=paths['main_folder'],
+            scripts_folder=paths['scripts_folder'],
+            cogs_folder=paths['cogs_folder'],
+            log_file=paths['log_file'],
+            bot_log_file=paths['bot_log_file'],
+            config_file=paths['config_file'],
+            pictures_folder=paths['pictures_folder'],
+            recordings_folder=paths.get('recordings_folder', os.path.join(paths['cogs_folder'], 'recordings')),
+            json_folder=paths.get('json_folder', os.path.join(paths['cogs_folder'], 'json')),
+        )
+
+    @property
+    def ai(self) -> AIConfig:
+        return AIConfig(
+            api_key=self['Anthropic']['API-KEY'],
+            allowed_users=[user.strip().lower() for user in self['AI']['allowed_users'].split(',') if user.strip()],
+            input_cost_per_1m_tokens=self.getfloat('AI', 'input_cost_per_1m_tokens'),
+            output_cost_per_1m_tokens=self.getfloat('AI', 'output_cost_per_1m_tokens'),
+            rate_limit=self.getfloat('AI', 'rate_limit'),
+            cache_ttl=self.getfloat('AI', 'cache_ttl', fallback=86400.0),
+            cache_size=self.getint('AI', 'cache_size', fallback=256),
+            usage_db=self.get('AI', 'usage_db', fallback=os.path.join(self.paths.json_folder, 'ai_usage.db')),
+            user_burst=self.getfloat('AI', 'user_burst', fallback=2.0),
+            global_requests_per_minute=self.getfloat('AI', 'global_requests_per_minute', fallback=30.0),
+            global_burst=self.getfloat('AI', 'global_burst', fallback=5.0),
+            max_concurrent=self.getint('AI', 'max_concurrent', fallback=3),
+            max_queued_per_user=self.getint('AI', 'max_queued_per_user', fallback=3),
+            system_prompt=self.get('AI', 'system_prompt', fallback=DEFAULT_SYSTEM_PROMPT),
+            context_tokens=self.getint('AI', 'context_tokens', fallback=4000),
+            context_idle_minutes=self.getfloat('AI', 'context_idle_minutes', fallback=60.0),
+            summarize_context=self.getboolean('AI', 'summarize_context', fallback=True),
+            tokenizer_file=self.get('AI', 'tokenizer_file', fallback=None),
+            fast_model=self.get('AI', 'fast_model', fallback=''),
+            fast_model_max_prompt_tokens=self.getint('AI', 'fast_model_max_prompt_tokens', fallback=60),
+            fast_input_cost_per_1m_tokens=self.getfloat('AI', 'fast_input_cost_per_1m_tokens', fallback=0.25),
+            fast_output_cost_per_1m_tokens=self.getfloat('AI', 'fast_output_cost_per_1m_tokens', fallback=1.25),
+            daily_user_budget=self.getfloat('AI', 'daily_user_budget', fallback=0.0),
+            monthly_budget=self.getfloat('AI', 'monthly_budget', fallback=0.0),
+            summarize_max_messages=self.getint('AI', 'summarize_max_messages', fallback=1000),
+            summarize_chunk_tokens=self.getint('AI', 'summarize_chunk_tokens', fallback=3000),
+            summarize_concurrency=self.getint('AI', 'summarize_concurrency', fallback=4),
+        )
+
+    # Change notifications
+
+    def subscribe(self, section: str, callback: Callable):
+        """Call `callback(config)` (sync or async) whenever `section` changes on disk."""
+        self._subscribers.setdefault(section, []).append(callback)
+
+    def unsubscribe(self, section: str, callback: Callable):
+        callbacks = self._subscribers.get(section, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def start_watching(self):
+        """Follow the config file for changes. Must be called from the event loop."""
+        if self._observer is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._observer = Observer()
+        self._observer.schedule(_ConfigFileHandler(self), os.path.dirname(self.path), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        logger.info(f"Watching {self.path} for changes")
+
+    def stop_watching(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def _schedule_reload(self):
+        # Called from the watchdog thread
+        self._loop.call_soon_threadsafe(self._debounce_reload)
+
+    def _debounce_reload(self):
+        if self._pending_reload is not None:
+            self._pending_reload.cancel()
+        self._pending_reload = self._loop.call_later(self.reload_delay, self.reload)
+
+    @staticmethod
+    def _raw_sections(parser: configparser.ConfigParser) -> Dict[str, Dict[str, str]]:
+        return {section: dict(parser.items(section, raw=True)) for section in parser.sections()}
+
+    def reload(self) -> List[str]:
+        """Re-read the file and notify subscribers. Returns the sections that changed."""
+        self._pending_reload = None
+        fresh = configparser.ConfigParser()
+        try:
+            if not fresh.read(self.path):
+                return []
+        except configparser.Error as e:
+            logger.error(f"Ignoring invalid config change in {self.path}: {e}")
+            return []
+
+        old_sections = self._raw_sections(self)
+        new_sections = self._raw_sections(fresh)
+        changed = [section for section in set(old_sections) | set(new_sections)
+                   if old_sections.get(section) != new_sections.get(section)]
+        if not changed:
+            return []
+
+        self.clear()
+        self.read_dict(new_sections)
+        logger.info(f"Config reloaded, changed sections: {', '.join(sorted(changed))}")
+
+        for section in changed:
+            for callback in list(self._subscribers.get(section, [])):
+                try:
+                    result = callback(self)
+                    if inspect.isawaitable(result):
+                        asyncio.ensure_future(result)
+                except Exception as e:
+                    logger.error(f"Config subscriber for [{section}] failed: {e}", exc_info=True)
+        return changed
+
+_config: Optional[BotConfig] = None
+
+def get_config() -> BotConfig:
+    """Return the process-wide config, parsing the file on first use."""
+    global _config
+    if _config is None:
+        _config = BotConfig()
+    return _config
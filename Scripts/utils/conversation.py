@@ -0,0 +1,172 @@
+"""
+Per-channel conversation memory for the AI cog.
+
+Each channel keeps its recent question/answer turns so follow-up questions
+have context. Tokens are counted locally with the `tokenizers` package
+(using the tokenizer file the anthropic SDK ships), and once a channel's
+history goes over its token budget the oldest turns are folded into a
+running summary (or dropped, when no summarizer is set) until the history
+is back under half the budget. Trimming in large steps keeps the start of
+the prompt unchanged between trims, so the system prompt, summary and older
+turns can be marked for Anthropic prompt caching. Breakpoints are only added
+for models that support caching, and only once the prefix is long enough for
+the model to cache it.
+
+The same counter splits channel history into token-sized parts for the
+`.summarize` command.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Models that support prompt caching, with the shortest prefix (in tokens) they will cache
+PROMPT_CACHE_MIN_TOKENS = {
+    "claude-3-5-sonnet-20240620": 1024,
+    "claude-3-opus-20240229": 1024,
+    "claude-3-haiku-20240307": 2048,
+}
+
+def has_cache_breakpoints(system: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> bool:
+    blocks = system + [block for message in messages for block in message["content"]]
+    return any("cache_control" in block for block in blocks)
+
+def default_tokenizer_file() -> str:
+    return os.path.join(os.path.dirname(anthropic.__file__), 'tokenizer.json')
+
+class TokenCounter:
+    """Local token estimates. Falls back to ~4 characters per token without a tokenizer file."""
+
+    def __init__(self, tokenizer_file: Optional[str] = None):
+        self.tokenizer = None
+        path = tokenizer_file or default_tokenizer_file()
+        try:
+            from tokenizers import Tokenizer
+            self.tokenizer = Tokenizer.from_file(path)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer from {path}, estimating tokens from length: {e}")
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return len(text) // 4 + 1
+        return len(self.tokenizer.encode(text).ids)
+
+    def chunks(self, lines: List[str], max_tokens: int) -> List[str]:
+        """Join consecutive lines into texts of at most about `max_tokens` tokens each.
+        A line longer than that gets a chunk of its own."""
+        chunks, current, current_tokens = [], [], 0
+        for line, tokens in zip(lines, self.count_batch(lines)):
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        if self.tokenizer is None:
+            return [self.count(text) for text in texts]
+        return [len(encoding.ids) for encoding in self.tokenizer.encode_batch(texts)]
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+@dataclass
+class Conversation:
+    turns: List[Turn] = field(default_factory=list)
+    summary: str = ""
+    summary_tokens: int = 0
+    last_active: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.turns and not self.summary
+
+    @property
+    def history_tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+# Receives the current summary and the turns being evicted, returns the new summary
+Summarizer = Callable[[str, List[Turn]], Awaitable[str]]
+
+class ConversationStore:
+    def __init__(self, counter: TokenCounter, budget_tokens: int, max_idle: float,
+                 summarizer: Optional[Summarizer] = None):
+        self.counter = counter
+        self.budget_tokens = budget_tokens
+        self.max_idle = max_idle  # seconds before a quiet channel starts over
+        self.summarizer = summarizer
+        self._conversations: Dict[int, Conversation] = {}
+
+    def get(self, channel_id: int) -> Conversation:
+        now = time.monotonic()
+        for key in [key for key, conv in self._conversations.items()
+                    if now - conv.last_active > self.max_idle and not conv.lock.locked()]:
+            del self._conversations[key]
+        conv = self._conversations.setdefault(channel_id, Conversation())
+        conv.last_active = now
+        return conv
+
+    def reset(self, channel_id: int) -> bool:
+        return self._conversations.pop(channel_id, None) is not None
+
+    def add_turn(self, conv: Conversation, question: str, answer: str):
+        conv.turns.append(Turn(question, answer, self.counter.count(question) + self.counter.count(answer)))
+
+    def needs_trim(self, conv: Conversation) -> bool:
+        return conv.history_tokens > self.budget_tokens
+
+    async def trim(self, conv: Conversation):
+        """Move the oldest turns out of the history until it uses at most half the budget."""
+        evicted = []
+        while conv.turns and conv.history_tokens > self.budget_tokens // 2:
+            evicted.append(conv.turns.pop(0))
+        if not evicted:
+            return
+        if self.summarizer is None:
+            logger.info(f"Dropped {len(evicted)} old conversation turns")
+            return
+        try:
+            conv.summary = await self.summarizer(conv.summary, evicted)
+            conv.summary_tokens = self.counter.count(conv.summary)
+            logger.info(f"Summarized {len(evicted)} old conversation turns into {conv.summary_tokens} tokens")
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation, dropping {len(evicted)} turns: {e}")
+
+    def build_request(self, conv: Conversation, system_prompt: str, question: str,
+                      model: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """System blocks and messages for `question`, with cache breakpoints after the stable prefix
+        when `model` supports prompt caching and the prefix is long enough to be cached."""
+        system_text = system_prompt
+        if conv.summary:
+            system_text += f"\n\nSummary of the earlier conversation in this channel:\n{conv.summary}"
+        system = [{"type": "text", "text": system_text}]
+        min_tokens = PROMPT_CACHE_MIN_TOKENS.get(model)
+        prefix_tokens = self.counter.count(system_text)
+        if min_tokens is not None and prefix_tokens >= min_tokens:
+            system[0]["cache_control"] = CACHE_CONTROL
+
+        messages = []
+        for turn in conv.turns:
+            messages.append({"role": "user", "content": [{"type": "text", "text": turn.question}]})
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": turn.answer}]})
+            prefix_tokens += turn.tokens
+        if messages and min_tokens is not None and prefix_tokens >= min_tokens:
+            # Everything up to the previous answer is the same as last time
+            messages[-1]["content"][0]["cache_control"] = CACHE_CONTROL
+        messages.append({"role": "user", "content": [{"type": "text", "text": question}]})
+        return system, messages
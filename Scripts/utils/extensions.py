@@ -0,0 +1,40 @@
+"""
+Timed extension loading.
+
+Everything that loads, unloads or reloads a cog goes through
+`run_extension_op` so that `bot.extension_timings` keeps how long each cog
+took to load and when it was last (re)loaded, whether that happened at
+startup or through the CogManager commands.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+OPERATIONS = ('load', 'unload', 'reload')
+
+@dataclass
+class ExtensionTiming:
+    load_seconds: float
+    loaded_at: datetime
+    reloaded_at: Optional[datetime] = None
+
+async def run_extension_op(bot, op: str, name: str) -> float:
+    """Load, unload or reload the extension `name` and return how long it took."""
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown extension operation {op}")
+    timings = bot.extension_timings
+
+    start = time.perf_counter()
+    await getattr(bot, f'{op}_extension')(name)
+    elapsed = time.perf_counter() - start
+
+    now = datetime.now(timezone.utc)
+    if op == 'unload':
+        timings.pop(name, None)
+    elif op == 'reload' and name in timings:
+        timings[name].load_seconds = elapsed
+        timings[name].reloaded_at = now
+    else:
+        timings[name] = ExtensionTiming(load_seconds=elapsed, loaded_at=now)
+    return elapsed
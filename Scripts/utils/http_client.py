@@ -0,0 +1,87 @@
+"""
+Shared HTTP client for the cogs.
+
+One aiohttp session with a pooled connector is kept for the life of the bot,
+so repeated calls to the same API reuse keep-alive connections and cached
+DNS lookups instead of paying a fresh TCP+TLS handshake each time.
+"""
+import time
+from typing import Dict, Optional
+
+import aiohttp
+
+from utils.metrics import add_external_time
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'total_latency', 'max_latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+class HttpClient:
+    def __init__(self, limit: int = 30, limit_per_host: int = 6, dns_cache_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, timeout: float = 15.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=min(5.0, timeout))
+        self.host_stats: Dict[str, HostStats] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_config(cls, config) -> 'HttpClient':
+        return cls(
+            limit=config.getint('HTTP', 'limit', fallback=30),
+            limit_per_host=config.getint('HTTP', 'limit_per_host', fallback=6),
+            dns_cache_ttl=config.getint('HTTP', 'dns_cache_ttl', fallback=300),
+            keepalive_timeout=config.getfloat('HTTP', 'keepalive_timeout', fallback=30.0),
+            timeout=config.getfloat('HTTP', 'timeout', fallback=15.0),
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use inside the event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                                  trace_configs=[self._trace_config()])
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, trace_config_ctx, params):
+            trace_config_ctx.start = time.perf_counter()
+
+        async def on_request_end(session, trace_config_ctx, params):
+            self._record(params.url.host, time.perf_counter() - trace_config_ctx.start, failed=params.response.status >= 500)
+
+        async def on_request_exception(session, trace_config_ctx, params):
+            self._record(params.url.host, time.perf_counter() - trace_config_ctx.start, failed=True)
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def _record(self, host: str, latency: float, failed: bool):
+        stats = self.host_stats.setdefault(host, HostStats())
+        stats.requests += 1
+        stats.errors += failed
+        stats.total_latency += latency
+        stats.max_latency = max(stats.max_latency, latency)
+        add_external_time(latency)
@@ -0,0 +1,78 @@
+"""
+Checks that image links actually serve an image before they are embedded.
+
+A link is asked for its headers with HEAD; servers that refuse HEAD (or
+don't say what they serve) get a GET for the first kilobyte instead. Either
+way only the status and content type are looked at, with a short timeout.
+Answers are cached per URL, and concurrent checks of the same URL share a
+request.
+"""
+import asyncio
+import logging
+from typing import Callable, Iterable, Optional
+
+import aiohttp
+
+from utils.cache import SingleFlight, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Statuses some servers give HEAD requests for files they would serve with GET
+HEAD_REFUSED = {403, 405, 501}
+
+class ImageLinkChecker:
+    def __init__(self, session: Callable[[], aiohttp.ClientSession], timeout: float = 3.0,
+                 cache_size: int = 512, cache_ttl: float = 3600.0):
+        self.session = session  # called for the session, so a recreated one is picked up
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.results = TTLCache(cache_size, cache_ttl)
+        self.in_flight = SingleFlight()
+
+    def known(self, url: str) -> Optional[bool]:
+        """The cached answer for `url`, or None if it hasn't been checked."""
+        return self.results.get(url) if url in self.results else None
+
+    async def is_image(self, url: str) -> bool:
+        result = self.results.get(url)
+        if result is None:
+            result, _ = await self.in_flight.do(url, lambda: self._check(url))
+        return result
+
+    async def _check(self, url: str) -> bool:
+        try:
+            ok = await self._request('HEAD', url)
+            if ok is None:
+                ok = await self._request('GET', url, headers={'Range': 'bytes=0-1023'})
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.debug(f"Image link {url} failed: {e!r}")
+            ok = False
+        self.results.set(url, bool(ok))
+        return bool(ok)
+
+    async def _request(self, method: str, url: str, headers: Optional[dict] = None) -> Optional[bool]:
+        """Whether the response is an image, or None when a HEAD answer doesn't tell."""
+        async with self.session().request(method, url, headers=headers, timeout=self.timeout,
+                                          allow_redirects=True) as response:
+            content_type = response.headers.get('Content-Type', '')
+            if method == 'HEAD' and (response.status in HEAD_REFUSED or (response.status < 400 and not content_type)):
+                return None
+            return response.status < 400 and content_type.lower().startswith('image/')
+
+    async def first_image(self, urls: Iterable[str]) -> Optional[str]:
+        """Check `urls` concurrently and return the first one found to be an image.
+
+        The remaining checks keep running in the background so their answers
+        are cached for later.
+        """
+        urls = list(dict.fromkeys(urls))
+        for url in urls:
+            if self.known(url):
+                return url
+        checks = {asyncio.ensure_future(self.is_image(url)): url for url in urls if self.known(url) is None}
+        pending = set(checks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            found = [checks[task] for task in done if not task.exception() and task.result()]
+            if found:
+                return min(found, key=urls.index)
+        return None
@@ -0,0 +1,101 @@
+"""
+A Discord reply that grows while its content is being produced.
+
+Text is appended as it arrives and a background task edits the message at
+most once per `interval` (Discord allows about five edits per five seconds
+per channel). When the content passes Discord's 2,000 character limit the
+rest continues in new messages.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+
+def split_pages(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split text into message-sized pages, breaking at a newline or space where possible."""
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind('\n', limit // 2, limit)
+        if cut == -1:
+            cut = text.rfind(' ', limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    pages.append(text)
+    return pages
+
+class LiveMessage:
+    def __init__(self, message: discord.Message, interval: float = 1.0, limit: int = MESSAGE_LIMIT,
+                 allowed_mentions: Optional[discord.AllowedMentions] = None):
+        self.messages = [message]
+        self.interval = interval
+        self.limit = limit
+        self.allowed_mentions = allowed_mentions  # None keeps the bot's default
+        self.text = ""
+        self._sent: List[str] = [message.content]
+        self._dirty = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = asyncio.create_task(self._flush_loop())
+
+    def append(self, text: str):
+        self.text += text
+        self._dirty.set()
+
+    def set_text(self, text: str):
+        self.text = text
+        self._dirty.set()
+
+    async def finish(self, suffix: str = "") -> List[discord.Message]:
+        """Stop the background edits, write the final content and return all messages used."""
+        if self._task is not None:
+            # Let an edit or send that is under way complete rather than cancelling it halfway,
+            # which could leave a page sent but not recorded and send it again below
+            self._stopping.set()
+            self._dirty.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.text += suffix
+        try:
+            await self._flush()
+        except discord.HTTPException as e:
+            logger.warning(f"Failed to finish live message: {e}")
+        return self.messages
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            if self._stopping.is_set():
+                return  # finish() writes the rest
+            # The first edit goes out immediately; later ones wait out the interval
+            wait = self._last_edit + self.interval - time.monotonic()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), wait)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            self._dirty.clear()
+            try:
+                await self._flush()
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to update live message: {e}")
+            self._last_edit = time.monotonic()
+
+    async def _flush(self):
+        pages = [page for page in split_pages(self.text, self.limit) if page]
+        for index, page in enumerate(pages):
+            if index < len(self.messages):
+                if self._sent[index] != page:
+                    await self.messages[index].edit(content=page, allowed_mentions=self.allowed_mentions)
+                    self._sent[index] = page
+            else:
+                self.messages.append(await self.messages[0].channel.send(page, allowed_mentions=self.allowed_mentions))
+                self._sent.append(page)
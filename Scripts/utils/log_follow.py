@@ -0,0 +1,117 @@
+"""
+`tail -f` for the log files.
+
+A LogFollower watches a log's directory with watchdog (inotify on the Pi)
+and, whenever the file changes, reads the bytes added since the last read
+in a thread and hands the complete new lines to a callback on the event
+loop. A slow poll covers missed events. Truncation (`.rmbot`) and rotation
+(a new file under the same name) start reading the new file from the top.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, List, Optional, Pattern
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from utils.log_tail import ENTRY_START, LEVELS
+
+logger = logging.getLogger(__name__)
+
+class EntryFilter:
+    """Decides line by line whether to show a followed log line. Continuation
+    lines (tracebacks) are shown when the entry they belong to is."""
+
+    def __init__(self, pattern: Optional[Pattern] = None, min_level: Optional[str] = None):
+        self.pattern = pattern
+        self.threshold = LEVELS[min_level] if min_level else 0
+        self._showing = pattern is None and not self.threshold
+
+    def __call__(self, line: str) -> bool:
+        match = ENTRY_START.match(line)
+        if match:
+            self._showing = LEVELS[match.group(1)] >= self.threshold and \
+                (self.pattern is None or bool(self.pattern.search(line)))
+        return self._showing
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, follower: 'LogFollower'):
+        self.follower = follower
+
+    def on_any_event(self, event):
+        # Called from the watchdog thread
+        paths = {getattr(event, 'src_path', None), getattr(event, 'dest_path', None)}
+        if self.follower.path in paths:
+            self.follower._loop.call_soon_threadsafe(self.follower._changed.set)
+
+class LogFollower:
+    def __init__(self, path: str, on_lines: Callable[[List[str]], None], poll_interval: float = 5.0):
+        self.path = os.path.abspath(path)
+        self.on_lines = on_lines
+        self.poll_interval = poll_interval
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._partial = b''
+        self._changed = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+
+    def _start_position(self):
+        try:
+            stat = os.stat(self.path)
+            self._offset, self._inode = stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            self._offset, self._inode = 0, None
+
+    def _read_new(self) -> List[str]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Rotated or cleared: the new content starts at the top
+            self._inode, self._offset, self._partial = stat.st_ino, 0, b''
+        if stat.st_size == self._offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = self._partial + f.read(stat.st_size - self._offset)
+        self._offset = stat.st_size
+        lines = data.split(b'\n')
+        self._partial = lines.pop()  # the last line may still be being written
+        return [line.decode('utf-8', errors='replace') for line in lines]
+
+    async def run(self, duration: float) -> bool:
+        """Follow the file for `duration` seconds or until `stop()`. Returns whether it was stopped."""
+        self._loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self._start_position)
+        observer = Observer()
+        observer.schedule(_ChangeHandler(self), os.path.dirname(self.path), recursive=False)
+        observer.daemon = True
+        observer.start()
+        deadline = time.monotonic() + duration
+        try:
+            while not self._stopped.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), min(self.poll_interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                if self._stopped.is_set():
+                    break
+                lines = await asyncio.to_thread(self._read_new)
+                if lines:
+                    self.on_lines(lines)
+        finally:
+            observer.stop()
+            await asyncio.to_thread(observer.join, 2.0)
+        return self._stopped.is_set()
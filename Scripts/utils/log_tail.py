@@ -0,0 +1,141 @@
+"""
+Reading the end of large log files without loading them.
+
+`tail_lines` seeks backwards from the end of a file one block at a time and
+stops as soon as it has enough lines. `search_logs` filters entries by text
+and level, newest file first: plain files are read backwards the same way
+and only until enough entries match, gzipped backups (bot.log.1.gz, ...) in
+one streaming pass, and older files are only opened when the newer ones
+don't have enough matches. Both do blocking file IO and are meant to be run
+in a thread.
+"""
+import gzip
+import os
+import re
+from collections import deque
+from typing import IO, Iterator, List, Optional, Pattern
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+# '%(asctime)s:%(levelname)s:...' as written by the bot and the scripts
+ENTRY_START = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}:(DEBUG|INFO|WARNING|ERROR|CRITICAL):')
+
+def tail_lines(path: str, count: int, block_size: int = 64 * 1024) -> List[str]:
+    """The last `count` lines of `path`, reading only the blocks at the end of the file."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        # One more newline than lines wanted, so the first (possibly partial) line can be dropped
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+    if position > 0:
+        lines = lines[1:]
+    return lines[-count:] if count > 0 else []
+
+def reversed_lines(path: str, block_size: int = 64 * 1024) -> Iterator[str]:
+    """The lines of `path` from last to first, reading blocks backwards from the end."""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        partial = b''
+        at_end = True
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + partial).split(b'\n')
+            partial = lines.pop(0)  # may continue in the block before
+            if at_end and lines and not lines[-1]:
+                lines.pop()  # nothing after the final newline
+            at_end = False
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace') + '\n'
+        if partial:
+            yield partial.decode('utf-8', errors='replace') + '\n'
+
+def rotated_files(path: str) -> List[str]:
+    """`path` followed by its rotated backups, newest first."""
+    directory, base = os.path.split(path)
+    backup = re.compile(re.escape(base) + r'\.(\d+)(\.gz)?')
+    found = {}
+    try:
+        names = os.listdir(directory or '.')
+    except OSError:
+        names = []
+    for name in names:
+        match = backup.fullmatch(name)
+        # While a backup is being compressed both bot.log.1 and bot.log.1.gz exist; only the first is complete
+        if match and (match.group(2) is None or int(match.group(1)) not in found):
+            found[int(match.group(1))] = os.path.join(directory, name)
+    return [path] + [found[index] for index in sorted(found)]
+
+def open_log(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def read_entries(path: str) -> Iterator[List[str]]:
+    """Log entries in `path` as lists of lines; continuation lines (tracebacks) stay with their entry."""
+    entry: List[str] = []
+    with open_log(path) as f:
+        for line in f:
+            if entry and ENTRY_START.match(line):
+                yield entry
+                entry = []
+            entry.append(line)
+    if entry:
+        yield entry
+
+def reversed_entries(path: str) -> Iterator[List[str]]:
+    """Like `read_entries`, from the last entry to the first."""
+    lines: List[str] = []
+    for line in reversed_lines(path):
+        lines.append(line)
+        if ENTRY_START.match(line):
+            yield lines[::-1]
+            lines = []
+    if lines:
+        yield lines[::-1]
+
+def entry_level(entry: List[str]) -> int:
+    match = ENTRY_START.match(entry[0])
+    return LEVELS[match.group(1)] if match else 0
+
+def search_logs(path: str, count: int, pattern: Optional[Pattern] = None,
+                min_level: Optional[str] = None) -> List[str]:
+    """The lines of the last `count` entries in `path` and its backups that contain `pattern`
+    and are at least `min_level`, oldest first. Only `count` entries are held in memory."""
+    threshold = LEVELS[min_level] if min_level else 0
+
+    def matches(entry: List[str]) -> bool:
+        return entry_level(entry) >= threshold and (pattern is None or any(pattern.search(line) for line in entry))
+
+    per_file = []  # newest file first
+    found = 0
+    for file in rotated_files(path):
+        wanted = count - found
+        try:
+            if file.endswith('.gz'):
+                found_here = list(deque(filter(matches, read_entries(file)), maxlen=wanted))
+            else:
+                found_here = []
+                for entry in reversed_entries(file):
+                    if matches(entry):
+                        found_here.append(entry)
+                        if len(found_here) == wanted:
+                            break
+                found_here.reverse()
+        except FileNotFoundError:
+            if file == path:
+                raise
+            continue  # rotated away meanwhile
+        except (EOFError, gzip.BadGzipFile):
+            continue  # still being compressed
+        per_file.append(found_here)
+        found += len(found_here)
+        if found >= count:
+            break
+    return [line for entries in reversed(per_file) for entry in entries for line in entry]
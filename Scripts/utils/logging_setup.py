@@ -0,0 +1,141 @@
+"""
+Non-blocking logging for the bot.
+
+Log calls on the event loop only put records on a queue; a QueueListener
+thread does the formatting and the writes to the SD card, and rotated logs
+are gzipped on a separate thread.
+"""
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(name)s:%(message)s'
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates when the file exceeds `max_bytes` or at midnight, keeping
+    `backup_count` gzipped backups (bot.log.1.gz, bot.log.2.gz, ...)."""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._rotate
+        self._compressor = None
+        self._rollover_at = self._next_midnight()
+
+    @staticmethod
+    def _next_midnight() -> float:
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        return time.mktime(tomorrow.timetuple())
+
+    def shouldRollover(self, record) -> bool:
+        if time.time() >= self._rollover_at:
+            self._rollover_at = self._next_midnight()
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        # The previous backup has to be fully compressed before the backups are shifted
+        self._wait_for_compressor()
+        self._recover_uncompressed()
+        super().doRollover()
+
+    def _recover_uncompressed(self):
+        """A backup that failed to compress is still bot.log.1, where the rollover would
+        overwrite it: compress it now, or failing that move it aside."""
+        pending = self.baseFilename + '.1'
+        if not os.path.exists(pending) or self._compress(pending, pending + '.gz'):
+            return
+        aside = stamped = f"{pending}.{time.strftime('%Y%m%d-%H%M%S')}"
+        suffix = 1
+        while os.path.exists(aside):
+            aside, suffix = f"{stamped}-{suffix}", suffix + 1
+        try:
+            os.replace(pending, aside)
+            print(f"Moved uncompressed log backup {pending} to {aside}")
+        except OSError as e:
+            print(f"Failed to move uncompressed log backup {pending} aside: {e}")
+
+    def _rotate(self, source: str, dest: str):
+        pending = dest[:-len('.gz')]
+        os.replace(source, pending)
+        self._compressor = threading.Thread(target=self._compress, args=(pending, dest),
+                                            name='log-compressor', daemon=True)
+        self._compressor.start()
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> bool:
+        try:
+            with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(source)
+            return True
+        except OSError as e:
+            # Leave the uncompressed backup in place rather than lose it (the next rollover retries it),
+            # and drop the partial archive so it isn't shifted along as a backup
+            print(f"Failed to compress rotated log {source}: {e}")
+            if os.path.exists(source):
+                try:
+                    os.remove(dest)
+                except OSError:
+                    pass
+            return False
+
+    def _wait_for_compressor(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def close(self):
+        self._wait_for_compressor()
+        super().close()
+
+def parse_module_levels(value: str) -> dict:
+    """Parse 'cogs.game:INFO, cogs.record:WARNING' into {logger name: level}."""
+    levels = {}
+    for entry in value.split(','):
+        if ':' not in entry:
+            continue
+        name, level = entry.rsplit(':', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+def apply_module_levels(levels: dict):
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+def apply_levels(config):
+    """Apply the root and per-logger levels from the [Logging] section."""
+    logging.getLogger().setLevel(config.get('Logging', 'level', fallback='INFO').upper())
+    apply_module_levels(parse_module_levels(config.get('Logging', 'module_levels', fallback='')))
+
+def setup_logging(config, log_file: str = None) -> logging.handlers.QueueListener:
+    """Route all logging through a queue to a rotating, compressing file handler.
+
+    Settings come from the optional [Logging] section of the config; the log
+    goes to `bot_log_file` unless `log_file` is given. The returned listener
+    must be stopped on shutdown to flush pending records.
+    """
+    file_handler = CompressingRotatingFileHandler(
+        log_file or config['Paths']['bot_log_file'],
+        max_bytes=config.getint('Logging', 'max_bytes', fallback=10 * 1024 * 1024),
+        backup_count=config.getint('Logging', 'backup_count', fallback=7),
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    apply_levels(config)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,148 @@
+"""
+Heavy media work run inside worker processes (see utils.workers).
+
+yt-dlp extraction for the music cog and pydub/speech recognition for the
+recorder. Everything here is synchronous and returns JSON-serializable
+values; only the functions listed in TASKS can be called from the bot.
+"""
+import io
+import logging
+import os
+import wave
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp
+
+def resolve_stream_url(webpage_url, ydl_opts):
+    """Resolve the direct audio stream URL for a single video."""
+    import yt_dlp
+    with yt_dlp.YoutubeDL(dict(ydl_opts, noplaylist=True)) as ydl:
+        return ydl.extract_info(webpage_url, download=False)['url']
+
+def _song(info, fallback_url=None):
+    return {'id': info.get('id'), 'url': info.get('url'), 'title': info.get('title'),
+            'duration': info.get('duration'), 'webpage_url': info.get('webpage_url', fallback_url)}
+
+def search(query, ydl_opts):
+    """Return the first yt-dlp search result for a query."""
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return _song(ydl.extract_info(f"ytsearch:{query}", download=False)['entries'][0])
+
+def extract(url, ydl_opts):
+    """Extract a video, or the flat entry list of a playlist."""
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if 'entries' in info:
+        return {'entries': [{'id': entry['id'], 'title': entry.get('title'), 'duration': entry.get('duration')}
+                            for entry in info['entries'] if entry and entry.get('id')]}
+    return _song(info, url)
+
+# Audio
+
+def check_wav_file(filename):
+    try:
+        with wave.open(filename, 'rb') as wf:
+            logger.debug(f"WAV file {filename}: channels={wf.getnchannels()}, width={wf.getsampwidth()}, "
+                         f"rate={wf.getframerate()}, frames={wf.getnframes()}, compression={wf.getcompname()}")
+        return True
+    except (wave.Error, OSError) as e:
+        logger.error(f"Error reading WAV file {filename}: {str(e)}")
+        return False
+
+def combine_chunks(chunk_filenames, output_filename):
+    """Concatenate the recorded chunk files into one WAV. The chunks are only deleted
+    once the combined file has been written, so a failure leaves them to recover from."""
+    from pydub import AudioSegment
+    combined = AudioSegment.empty()
+    combined_chunks = []
+    for chunk_filename in chunk_filenames:
+        if not check_wav_file(chunk_filename):
+            logger.error(f"Chunk file {chunk_filename} is not a valid WAV file")
+            continue
+        combined += AudioSegment.from_wav(chunk_filename)
+        combined_chunks.append(chunk_filename)
+
+    combined.export(output_filename, format="wav")
+    logger.debug(f"Recording saved to {output_filename}")
+    if not check_wav_file(output_filename):
+        return False
+    for chunk_filename in combined_chunks:
+        os.remove(chunk_filename)
+    return True
+
+def process_audio(input_file, output_file):
+    """Boost and normalize a recording."""
+    from pydub import AudioSegment
+    from pydub.effects import normalize
+    logger.info(f"Starting audio processing for {input_file}")
+    audio = AudioSegment.from_wav(input_file)
+    logger.info(f"Loaded audio file: duration={len(audio)}ms, channels={audio.channels}")
+
+    # Increase volume by 50%
+    audio = audio + 6  # Increasing by 6dB is roughly equivalent to 150% volume
+    audio = normalize(audio)
+    audio.export(output_file, format="wav")
+    logger.info(f"Exported processed audio to {output_file}")
+    return True
+
+def transcribe(filename, progress):
+    """Transcribe a WAV file in 60 second chunks, reporting each chunk number as progress."""
+    import speech_recognition as sr
+    recognizer = sr.Recognizer()
+    recognizer.energy_threshold = 300  # Adjust this value as needed
+
+    full_transcript = ""
+    with wave.open(filename, 'rb') as wf:
+        frame_rate = wf.getframerate()
+        n_channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        n_frames = wf.getnframes()
+
+        logger.debug(f"Audio file details: rate={frame_rate}, channels={n_channels}, width={sample_width}, frames={n_frames}")
+
+        chunk_duration = 60  # 60 seconds
+        chunk_size = int(chunk_duration * frame_rate * n_channels * sample_width)
+
+        for i in range(0, n_frames, chunk_size):
+            chunk_number = i // chunk_size + 1
+            wf.setpos(i)
+            chunk = wf.readframes(min(chunk_size, n_frames - i))
+
+            with io.BytesIO() as chunk_io:
+                with wave.open(chunk_io, 'wb') as chunk_wf:
+                    chunk_wf.setnchannels(n_channels)
+                    chunk_wf.setsampwidth(sample_width)
+                    chunk_wf.setframerate(frame_rate)
+                    chunk_wf.writeframes(chunk)
+
+                chunk_io.seek(0)
+                with sr.AudioFile(chunk_io) as source:
+                    audio = recognizer.record(source)
+
+            try:
+                # Try Google first, then fall back to Sphinx if it fails
+                try:
+                    transcript = recognizer.recognize_google(audio)
+                except sr.UnknownValueError:
+                    transcript = recognizer.recognize_sphinx(audio)
+                full_transcript += transcript + " "
+                logger.debug(f"Transcribed chunk {chunk_number}: {transcript}")
+                progress(chunk_number)
+            except sr.UnknownValueError:
+                logger.warning(f"Could not understand audio in chunk {chunk_number}")
+            except sr.RequestError as e:
+                logger.error(f"Error in chunk {chunk_number}: {str(e)}")
+
+    return full_transcript
+
+TASKS = {
+    'resolve_stream_url': resolve_stream_url,
+    'search': search,
+    'extract': extract,
+    'combine_chunks': combine_chunks,
+    'process_audio': process_audio,
+    'transcribe': transcribe,
+}
@@ -0,0 +1,93 @@
+"""
+Process memory and discord.py cache sizes, for the low-memory profile and
+the owner diagnostics commands.
+
+Allocations can be attributed to cogs with tracemalloc. Tracing is started
+at boot when [Diagnostics] tracemalloc_frames is above 0 (it is off when
+the setting is missing; the shipped .config sets 1). A traceback that
+shallow can stay on in production; with a single frame an allocation
+counts towards a cog when the cog's own code made it.
+"""
+import os
+import resource
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None if it can't be read."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return "n/a"
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+def cache_counts(bot) -> Dict[str, int]:
+    """Object counts of the client's caches."""
+    guilds = bot.guilds
+    return {
+        'guilds': len(guilds),
+        'users': len(bot.users),
+        'members': sum(len(guild.members) for guild in guilds),
+        'channels': sum(len(guild.channels) for guild in guilds),
+        'threads': sum(len(guild.threads) for guild in guilds),
+        'roles': sum(len(guild.roles) for guild in guilds),
+        'emojis': len(bot.emojis),
+        'stickers': len(bot.stickers),
+        'messages': len(bot.cached_messages),
+        'private channels': len(bot.private_channels),
+        'voice clients': len(bot.voice_clients),
+    }
+
+def start_tracing(nframes: int):
+    """Start tracemalloc with `nframes` frames per traceback (0 leaves it off)."""
+    if nframes > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+
+@dataclass
+class ExtensionMemory:
+    name: str
+    size: int
+    count: int
+    size_diff: int
+    count_diff: int
+
+def extension_files(bot) -> Dict[str, str]:
+    """Source file of each loaded extension, keyed by extension name."""
+    return {name: os.path.abspath(module.__file__) for name, module in bot.extensions.items()
+            if getattr(module, '__file__', None)}
+
+def _totals(snapshot: tracemalloc.Snapshot) -> Tuple[int, int]:
+    stats = snapshot.statistics('filename')
+    return sum(stat.size for stat in stats), sum(stat.count for stat in stats)
+
+def compare_extensions(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, files: Dict[str, str],
+                       top: int) -> Tuple[List[ExtensionMemory], List[tracemalloc.StatisticDiff]]:
+    """Live allocations per extension in `after` and how they changed since `before`,
+    plus the `top` source lines with the largest change. Slow; run it off the event loop."""
+    # Narrow both snapshots to the cogs once, then split that much smaller set per cog
+    filters = [tracemalloc.Filter(True, path, all_frames=True) for path in files.values()]
+    before = before.filter_traces(filters)
+    after = after.filter_traces(filters)
+
+    usage = []
+    for name, path in files.items():
+        cog_filter = [tracemalloc.Filter(True, path, all_frames=True)]
+        size, count = _totals(after.filter_traces(cog_filter))
+        old_size, old_count = _totals(before.filter_traces(cog_filter))
+        usage.append(ExtensionMemory(name, size, count, size - old_size, count - old_count))
+    usage.sort(key=lambda item: item.size, reverse=True)
+
+    return usage, after.compare_to(before, 'lineno')[:top]
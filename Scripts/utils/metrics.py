@@ -0,0 +1,206 @@
+"""
+Bot-wide performance metrics.
+
+Every command invocation is timed through the bot's before/after invoke
+hooks. Time spent waiting on Discord's HTTP API is picked up through an
+aiohttp trace config on the bot's HTTP client, and time spent on other
+services is recorded by the shared HTTP client or marked by cogs with
+`track_external()`. A background probe measures event-loop lag, and
+everything is periodically written out in Prometheus text format for local
+scraping.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+class Histogram:
+    """Cumulative Prometheus-style buckets plus a window of recent samples for percentiles."""
+
+    def __init__(self, window: int = 1024):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def cumulative_buckets(self):
+        total = 0
+        for bound, count in zip(BUCKETS, self.bucket_counts):
+            total += count
+            yield bound, total
+
+class CommandTiming:
+    """Time accumulated by a single command invocation."""
+    __slots__ = ('start', 'external', 'discord')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.external = 0.0
+        self.discord = 0.0
+
+_current_timing: contextvars.ContextVar[Optional[CommandTiming]] = contextvars.ContextVar('current_timing', default=None)
+
+def add_external_time(seconds: float):
+    """Attribute time spent on an external API to the running command, if any."""
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.external += seconds
+
+@contextlib.contextmanager
+def track_external():
+    """Attribute the time spent inside the block to external APIs for the running command."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_external_time(time.perf_counter() - start)
+
+class Metrics:
+    def __init__(self, prometheus_file: str, export_interval: float = 15.0, lag_interval: float = 0.5):
+        self.prometheus_file = prometheus_file
+        self.export_interval = export_interval
+        self.lag_interval = lag_interval
+        self.command_latency: Dict[str, Histogram] = {}
+        self.command_external: Dict[str, Histogram] = {}
+        self.command_discord: Dict[str, Histogram] = {}
+        self.command_errors: Dict[str, int] = {}
+        self.loop_lag = Histogram()
+        self._tasks = []
+
+    # Discord HTTP time, collected through discord.py's http_trace option
+
+    def discord_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, trace_config_ctx, params):
+            trace_config_ctx.start = time.perf_counter()
+
+        async def on_request_done(session, trace_config_ctx, params):
+            timing = _current_timing.get()
+            if timing is not None:
+                timing.discord += time.perf_counter() - trace_config_ctx.start
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_done)
+        trace_config.on_request_exception.append(on_request_done)
+        return trace_config
+
+    # Command hooks
+
+    def install(self, bot):
+        """Register the invoke hooks and listeners on the bot."""
+
+        @bot.before_invoke
+        async def start_timing(ctx):
+            _current_timing.set(CommandTiming())
+
+        @bot.after_invoke
+        async def stop_timing(ctx):
+            timing = _current_timing.get()
+            if timing is None:
+                return
+            _current_timing.set(None)
+            name = ctx.command.qualified_name
+            self.command_latency.setdefault(name, Histogram()).observe(time.perf_counter() - timing.start)
+            self.command_external.setdefault(name, Histogram()).observe(timing.external)
+            self.command_discord.setdefault(name, Histogram()).observe(timing.discord)
+
+        async def count_error(ctx, error):
+            if ctx.command is not None:
+                name = ctx.command.qualified_name
+                self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+        bot.add_listener(count_error, 'on_command_error')
+
+    # Background tasks
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._probe_loop_lag()),
+                           asyncio.create_task(self._export_loop())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _probe_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag.observe(max(0.0, loop.time() - scheduled - self.lag_interval))
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(self.export_interval)
+            try:
+                await asyncio.to_thread(self._write_prometheus, self.render_prometheus())
+            except OSError as e:
+                logger.warning(f"Failed to write metrics file {self.prometheus_file}: {e}")
+
+    # Prometheus text format
+
+    def _write_prometheus(self, text: str):
+        tmp_file = f"{self.prometheus_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(text)
+        os.replace(tmp_file, self.prometheus_file)
+
+    @staticmethod
+    def _render_histogram(lines, name, histogram, labels=''):
+        separator = ',' if labels else ''
+        for bound, total in histogram.cumulative_buckets():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{le}"}} {total}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {histogram.sum}')
+        lines.append(f'{name}_count{suffix} {histogram.count}')
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name, help_text, histograms in (
+            ('discord_bot_command_duration_seconds', 'Wall time of command invocations.', self.command_latency),
+            ('discord_bot_command_external_seconds', 'Time commands spent waiting on external APIs.', self.command_external),
+            ('discord_bot_command_discord_seconds', 'Time commands spent in Discord HTTP requests.', self.command_discord),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for command, histogram in sorted(histograms.items()):
+                self._render_histogram(lines, name, histogram, f'command="{command}"')
+
+        lines.append('# HELP discord_bot_command_errors_total Commands that raised an error.')
+        lines.append('# TYPE discord_bot_command_errors_total counter')
+        for command, count in sorted(self.command_errors.items()):
+            lines.append(f'discord_bot_command_errors_total{{command="{command}"}} {count}')
+
+        lines.append('# HELP discord_bot_event_loop_lag_seconds Delay of the event loop probe past its deadline.')
+        lines.append('# TYPE discord_bot_event_loop_lag_seconds histogram')
+        self._render_histogram(lines, 'discord_bot_event_loop_lag_seconds', self.loop_lag)
+        return '\n'.join(lines) + '\n'
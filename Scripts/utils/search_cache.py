@@ -0,0 +1,153 @@
+"""
+Persistent cache of Google Custom Search results.
+
+Each page of results (10 items, starting at the `start` index Google pages
+by) is stored in SQLite with the time it was fetched, so results survive
+restarts; the caller decides whether an entry is fresh, stale but usable
+while it is refreshed, or too old. The same database counts the API
+queries made per day. Cluster processes share the database, so the count
+is read back from it rather than kept per process. Google resets the free
+quota at midnight Pacific time, so days are counted in that timezone.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- Older cache without pages
+DROP TABLE IF EXISTS results;
+CREATE TABLE IF NOT EXISTS result_pages (
+    query TEXT NOT NULL,
+    search_type TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    items TEXT NOT NULL,
+    PRIMARY KEY (query, search_type, start)
+);
+CREATE TABLE IF NOT EXISTS quota (
+    day TEXT PRIMARY KEY,
+    queries INTEGER NOT NULL
+);
+"""
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:  # no zoneinfo or no tz database
+    QUOTA_TIMEZONE = timezone.utc
+
+class QuotaExceeded(Exception):
+    """Raised when a search would need an API query but today's quota is used up."""
+
+def quota_day() -> str:
+    return datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')
+
+class SearchStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # One thread owns the connection, so database work is serialized and never runs on the loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-cache')
+        self._day = ''
+        self._used = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    async def open(self):
+        await self._run(self._open)
+        self._day = quota_day()
+        self._used = await self._run(self._read_quota, self._day)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    # Results
+
+    def _get(self, query: str, search_type: str, start: int) -> Optional[Tuple[float, str]]:
+        return self._conn.execute('SELECT fetched_at, items FROM result_pages '
+                                  'WHERE query = ? AND search_type = ? AND start = ?',
+                                  (query, search_type, start)).fetchone()
+
+    async def get(self, query: str, search_type: str, start: int = 1) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        """The stored results and when they were fetched (wall clock), or None."""
+        row = await self._run(self._get, query, search_type, start)
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _put(self, query: str, search_type: str, start: int, fetched_at: float, items: str):
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO result_pages (query, search_type, start, fetched_at, items) '
+                               'VALUES (?, ?, ?, ?, ?)', (query, search_type, start, fetched_at, items))
+
+    async def put(self, query: str, search_type: str, start: int, items: List[Dict[str, Any]]):
+        await self._run(self._put, query, search_type, start, time.time(), json.dumps(items))
+
+    def _prune(self, before: float) -> int:
+        with self._conn:
+            return self._conn.execute('DELETE FROM result_pages WHERE fetched_at < ?', (before,)).rowcount
+
+    async def prune(self, max_age: float) -> int:
+        """Forget results fetched more than `max_age` seconds ago."""
+        return await self._run(self._prune, time.time() - max_age)
+
+    # Daily quota
+
+    def _read_quota(self, day: str) -> int:
+        row = self._conn.execute('SELECT queries FROM quota WHERE day = ?', (day,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_query(self, day: str) -> int:
+        with self._conn:
+            self._conn.execute('INSERT INTO quota (day, queries) VALUES (?, 1) '
+                               'ON CONFLICT (day) DO UPDATE SET queries = queries + 1', (day,))
+            # Read in the same transaction, so the count includes every process's queries
+            return self._read_quota(day)
+
+    def _roll_over(self):
+        day = quota_day()
+        if day != self._day:
+            self._day, self._used = day, 0
+
+    @property
+    def used_today(self) -> int:
+        """Today's queries as of the last time they were counted or read."""
+        self._roll_over()
+        return self._used
+
+    async def queries_today(self) -> int:
+        """Today's queries read from the database, including those of other processes."""
+        self._roll_over()
+        try:
+            self._used = max(self._used, await self._run(self._read_quota, self._day))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read search quota from {self.path}: {e}")
+        return self._used
+
+    async def count_query(self):
+        """Count one API query against today's quota."""
+        self._roll_over()
+        try:
+            self._used = await self._run(self._add_query, self._day)
+        except sqlite3.Error as e:
+            self._used += 1
+            logger.error(f"Failed to record search quota in {self.path}: {e}")
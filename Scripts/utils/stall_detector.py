@@ -0,0 +1,117 @@
+"""
+Event-loop stall detection.
+
+A heartbeat task on the event loop stamps the time every fraction of the
+threshold. A watchdog thread checks the stamp; when the loop has not ticked
+for longer than the threshold it grabs the loop thread's current stack with
+`sys._current_frames()` and files the stall under the innermost frame that
+belongs to the bot's own code.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BOT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class StallSite:
+    """Stalls aggregated for one call site."""
+    __slots__ = ('call_site', 'count', 'total', 'longest', 'stack')
+
+    def __init__(self, call_site: str, stack: List[str]):
+        self.call_site = call_site
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.stack = stack
+
+class StallDetector:
+    def __init__(self, threshold_ms: float = 250.0):
+        self.threshold = threshold_ms / 1000
+        self.last_tick = time.monotonic()
+        self.sites: Dict[str, StallSite] = {}
+        self.stall_count = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start watching the running event loop. Must be called from the loop thread."""
+        if self._thread is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='stall-detector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.sites.clear()
+            self.stall_count = 0
+
+    def top_sites(self, limit: int = 10) -> List[StallSite]:
+        with self._lock:
+            return sorted(self.sites.values(), key=lambda site: site.total, reverse=True)[:limit]
+
+    async def _heartbeat_loop(self):
+        while True:
+            self.last_tick = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self):
+        stalled_tick = None
+        site = None
+        while not self._stop.wait(self.threshold / 4):
+            tick = self.last_tick
+            if time.monotonic() - tick > self.threshold:
+                if site is None:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is None:
+                        continue
+                    site = self._site_for(traceback.extract_stack(frame))
+                    stalled_tick = tick
+            elif site is not None:
+                # The heartbeat fires as soon as the loop is free again, so the gap
+                # between the two ticks (less one heartbeat interval) is the stall
+                duration = max(self.threshold, tick - stalled_tick - self.threshold / 4)
+                self._record(site, duration)
+                site = None
+
+    def _site_for(self, stack: traceback.StackSummary) -> StallSite:
+        own_frames = [frame for frame in stack if frame.filename.startswith(BOT_ROOT)]
+        culprit = own_frames[-1] if own_frames else stack[-1]
+        call_site = f"{os.path.relpath(culprit.filename, BOT_ROOT)}:{culprit.lineno} in {culprit.name}"
+        formatted = [f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}" for frame in stack[-12:]]
+        with self._lock:
+            site = self.sites.get(call_site)
+            if site is None:
+                site = self.sites[call_site] = StallSite(call_site, formatted)
+            else:
+                site.stack = formatted
+        return site
+
+    def _record(self, site: StallSite, duration: float):
+        with self._lock:
+            site.count += 1
+            site.total += duration
+            site.longest = max(site.longest, duration)
+            self.stall_count += 1
+        logger.warning(f"Event loop stalled for {duration * 1000:.0f}ms at {site.call_site}\n"
+                       + "\n".join(f"  {line}" for line in site.stack))
@@ -0,0 +1,177 @@
+"""
+Persistent AI usage accounting.
+
+Every billed request is recorded in a SQLite database. `record()` only
+queues the row; a background task writes queued rows in one transaction
+every few seconds (or sooner once a batch fills up), so commands never wait
+on the disk. Each flush also updates a per-day rollup table keyed by day,
+user and guild, and the stats queries read from that rollup through its
+indexes instead of scanning the raw rows.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_usage (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    guild_id INTEGER NOT NULL,
+    requests INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (day, user, guild_id)
+);
+CREATE INDEX IF NOT EXISTS daily_usage_user ON daily_usage (user, day);
+CREATE INDEX IF NOT EXISTS daily_usage_guild ON daily_usage (guild_id, day);
+"""
+
+ROLLUP = """
+INSERT INTO daily_usage (day, user, guild_id, requests, input_tokens, output_tokens, cost)
+VALUES (?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (day, user, guild_id) DO UPDATE SET
+    requests = requests + 1,
+    input_tokens = input_tokens + excluded.input_tokens,
+    output_tokens = output_tokens + excluded.output_tokens,
+    cost = cost + excluded.cost
+"""
+
+TOTALS = "SELECT SUM(requests), SUM(input_tokens), SUM(output_tokens), SUM(cost) FROM daily_usage"
+
+@dataclass
+class UsageTotals:
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+def today() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+def month_start() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-01')
+
+class UsageLedger:
+    def __init__(self, path: str, flush_interval: float = 5.0, batch_size: int = 100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Tuple] = []
+        self._batch_ready = asyncio.Event()
+        self._conn: Optional[sqlite3.Connection] = None
+        # One thread owns the connection, so database work is serialized and never runs on the loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='usage-ledger')
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    async def open(self):
+        await self._run(self._open)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def record(self, user: str, guild_id: Optional[int], model: str,
+               input_tokens: int, output_tokens: int, cost: float):
+        """Queue one billed request. DMs are recorded under guild 0."""
+        self._pending.append((time.time(), today(), user, guild_id or 0, model, input_tokens, output_tokens, cost))
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write AI usage to {self.path}: {e}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await self._run(self._write, rows)
+        except sqlite3.Error:
+            # Keep the rows for the next attempt
+            self._pending[:0] = rows
+            raise
+
+    def _write(self, rows: List[Tuple]):
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO usage (ts, day, user, guild_id, model, input_tokens, output_tokens, cost) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._conn.executemany(ROLLUP, [(day, user, guild_id, input_tokens, output_tokens, cost)
+                                            for _, day, user, guild_id, _, input_tokens, output_tokens, cost in rows])
+
+    # Aggregates (rows still waiting to be written are included)
+
+    def _query_totals(self, where: str, args: Tuple) -> UsageTotals:
+        requests, input_tokens, output_tokens, cost = self._conn.execute(f"{TOTALS} WHERE {where}", args).fetchone()
+        return UsageTotals(requests or 0, input_tokens or 0, output_tokens or 0, cost or 0.0)
+
+    async def _totals(self, where: str, args: Tuple, pending_filter) -> UsageTotals:
+        # Taken before the query: rows that a flush picks up meanwhile are written after it
+        pending = list(self._pending)
+        totals = await self._run(self._query_totals, where, args)
+        for _, day, user, guild_id, _, input_tokens, output_tokens, cost in pending:
+            if pending_filter(day, user, guild_id):
+                totals.requests += 1
+                totals.input_tokens += input_tokens
+                totals.output_tokens += output_tokens
+                totals.cost += cost
+        return totals
+
+    async def user_totals(self, user: str, since_day: str = '') -> UsageTotals:
+        return await self._totals('user = ? AND day >= ?', (user, since_day),
+                                  lambda day, u, guild_id: u == user and day >= since_day)
+
+    async def guild_totals(self, guild_id: Optional[int], since_day: str = '') -> UsageTotals:
+        guild_id = guild_id or 0
+        return await self._totals('guild_id = ? AND day >= ?', (guild_id, since_day),
+                                  lambda day, user, g: g == guild_id and day >= since_day)
+
+    async def day_totals(self, since_day: str) -> UsageTotals:
+        return await self._totals('day >= ?', (since_day,), lambda day, user, guild_id: day >= since_day)
@@ -0,0 +1,233 @@
+"""
+Supervised worker processes for CPU- and IO-heavy cog work.
+
+The bot process owns a Unix socket per worker and starts the worker with
+`python -m utils.workers <socket> <tasks module>`. Messages are
+length-prefixed JSON frames. The worker runs the functions listed in the
+tasks module's TASKS dict on its own threads, streams progress and log
+records back, and exits when the bot goes away. If a worker dies, its
+pending calls fail with WorkerError and the supervisor restarts it with
+backoff.
+"""
+import asyncio
+import functools
+import importlib
+import inspect
+import itertools
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BOT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADER = struct.Struct('>I')
+
+class WorkerError(Exception):
+    """Raised when a worker task fails or the worker process goes away."""
+
+def write_frame(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    payload = json.dumps(message).encode('utf-8')
+    writer.write(HEADER.pack(len(payload)) + payload)
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return json.loads(await reader.readexactly(length))
+
+class WorkerProcess:
+    """Parent-side handle for one supervised worker process."""
+
+    def __init__(self, name: str, tasks_module: str, start_timeout: float = 30.0):
+        self.name = name
+        self.tasks_module = tasks_module
+        self.start_timeout = start_timeout
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.restart_count = 0
+        self._connected = asyncio.Event()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, Tuple[asyncio.Future, Optional[Callable]]] = {}
+        self._progress_tasks = set()
+        self._ids = itertools.count()
+        self._server = None
+        self._socket_dir = None
+        self._socket_path = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        if self._supervisor is not None:
+            return
+        self._stopping = False
+        self._socket_dir = tempfile.mkdtemp(prefix=f'bot-{self.name}-')  # created with mode 0700
+        self._socket_path = os.path.join(self._socket_dir, 'worker.sock')
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self._socket_path)
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        self._stopping = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+        self._fail_pending(WorkerError(f"{self.name} worker stopped"))
+
+    async def call(self, task: str, *args, on_progress: Optional[Callable] = None, timeout: Optional[float] = None):
+        """Run `task` in the worker and return its result.
+
+        `on_progress` (sync or async) receives any progress values the task reports. An async
+        callback runs as its own task, so it doesn't hold up reading the worker's replies.
+        """
+        try:
+            await asyncio.wait_for(self._connected.wait(), self.start_timeout)
+        except asyncio.TimeoutError:
+            raise WorkerError(f"{self.name} worker is not running")
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (future, on_progress)
+        try:
+            write_frame(self._writer, {'id': request_id, 'task': task, 'args': args})
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._connected.set()
+        try:
+            while True:
+                await self._handle(await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connected.clear()
+            writer.close()
+
+    async def _handle(self, message: Dict[str, Any]):
+        if 'log' in message:
+            record = message['log']
+            logging.getLogger(record['name']).log(record['level'], f"[{self.name} worker] {record['message']}")
+            return
+
+        future, on_progress = self._pending.get(message['id'], (None, None))
+        if future is None or future.done():
+            return
+        if 'progress' in message:
+            if on_progress is not None:
+                result = on_progress(message['progress'])
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._progress_tasks.add(task)
+                    task.add_done_callback(self._progress_done)
+        elif message['ok']:
+            future.set_result(message['result'])
+        else:
+            future.set_exception(WorkerError(message['error']))
+
+    def _progress_done(self, task: asyncio.Future):
+        self._progress_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"{self.name} worker progress callback failed: {task.exception()!r}")
+
+    def _fail_pending(self, error: WorkerError):
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _supervise(self):
+        delay = 1.0
+        while not self._stopping:
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'utils.workers', self._socket_path, self.tasks_module, cwd=BOT_ROOT)
+            logger.info(f"Started {self.name} worker (pid {self.process.pid})")
+            returncode = await self.process.wait()
+            self._fail_pending(WorkerError(f"{self.name} worker exited with code {returncode}"))
+            if self._stopping:
+                break
+
+            # Back off if the worker keeps crashing, reset once it has stayed up for a while
+            delay = 1.0 if time.monotonic() - started > 60 else min(delay * 2, 60.0)
+            self.restart_count += 1
+            logger.warning(f"{self.name} worker exited with code {returncode}, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+# Worker side
+
+class _ForwardingHandler(logging.Handler):
+    """Sends the worker's log records to the bot so they end up in bot.log."""
+
+    def __init__(self, send: Callable):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.send({'log': {'name': record.name, 'level': record.levelno, 'message': self.format(record)}})
+        except RuntimeError:
+            pass  # the loop is already closed
+
+async def _serve(socket_path: str, tasks_module: str):
+    tasks = importlib.import_module(tasks_module).TASKS
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='worker-task')
+
+    def send_threadsafe(message):
+        loop.call_soon_threadsafe(write_frame, writer, message)
+
+    logging.getLogger().addHandler(_ForwardingHandler(send_threadsafe))
+    logging.getLogger().setLevel(logging.INFO)
+
+    async def run(request):
+        fn = tasks.get(request['task'])
+        try:
+            if fn is None:
+                raise KeyError(f"Unknown task {request['task']}")
+            call = functools.partial(fn, *request['args'])
+            if 'progress' in inspect.signature(fn).parameters:
+                call = functools.partial(call, progress=lambda value: send_threadsafe({'id': request['id'], 'progress': value}))
+            result = await loop.run_in_executor(executor, call)
+            write_frame(writer, {'id': request['id'], 'ok': True, 'result': result})
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Task {request['task']} failed: {e}", exc_info=True)
+            write_frame(writer, {'id': request['id'], 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+    running = set()
+    try:
+        while True:
+            task = asyncio.create_task(run(await read_frame(reader)))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass  # the bot closed the socket
+
+def main():
+    socket_path, tasks_module = sys.argv[1:3]
+    # Keep the bot process ahead of heavy work when competing for the CPU
+    os.nice(10)
+    asyncio.run(_serve(socket_path, tasks_module))
+    # Don't wait for task threads that are still running once the bot is gone
+    os._exit(0)
+
+if __name__ == '__main__':
+    main()